@@ -1,56 +1,101 @@
 import streamlit as st
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import io
-from PIL import Image
-from dateutil import parser
 import numpy as np
-from datetime import datetime
-from wordcloud import WordCloud
-from collections import Counter
-import joblib
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
-import matplotlib.dates as mdates
-
-
-# Load DataFrames, ignoring the index column if it's present
-@st.cache
-def load_data():
-    try:
-        hotel_info = pd.read_csv('hotel_profiles.csv')  # Adjust index_col as needed
-        data_final = pd.read_csv('data_final.csv')
-        return hotel_info, data_final
-    except Exception as e:
-        st.error(f"Error loading data: {e}")
-        return pd.DataFrame(), pd.DataFrame()
-
-hotel_info, data_final = load_data()
-
-# Sort hotel_info DataFrame by 'num' column in ascending order
-hotel_info_sorted = hotel_info.sort_values(by='num')
+import uuid
+import tracing
+from tracing import span
+from compact_model import warm_up
+from review_store import get_store
+from data_loading import read_sample
+from rollup_cube import get_cube
+from chart_cache import chart_cache
+from chart_pipeline import ChartPipeline
+from token_index import get_token_index
+from hotel_reports import hotel_sections
+from scoring import SENTIMENT_LABELS
+from scoring_service import request_predictions, predict_locally
+from text_normalization import normalize_batch
+from hotel_search import get_search_index
+from leaderboard import get_leaderboard, ALL_CRITERIA, DEFAULT_WEIGHTS
+from explanations import explain_texts, explain_sklearn, format_terms
+# evaluation_cache (sklearn, seaborn) and insight_charts (seaborn, wordcloud) are imported by
+# the pages that use them (insight_charts through hotel_sections), so a cold start doesn't pay
+# for them on every page
+
+
+# Tracing is off unless TRACING_ENABLED is set. Spans of this script run carry its session and
+# run ids; metrics go to METRICS_FILE and, when METRICS_PORT is set, a /metrics endpoint.
+trace_run = uuid.uuid4().hex[:8]
+tracing.context(session=st.session_state.setdefault('trace_session', uuid.uuid4().hex[:8]), run=trace_run)
+tracing.register_stats('chart_cache', chart_cache.stats, counters=['hits', 'misses', 'evictions'])
+tracing.start_metrics_server()
+
+# Reviews are served per hotel from a partitioned store built once from data_final.csv
+try:
+    with span('load.review_store'):
+        review_store = get_store()
+except Exception as e:
+    st.error(f"Error loading data: {e}")
+    review_store = None
+
+# Per-hotel monthly aggregates, precomputed once from the review store
+try:
+    with span('load.rollup_cube'):
+        rollup_cube = get_cube()
+except Exception as e:
+    st.error(f"Error loading data: {e}")
+    rollup_cube = None
+
+# Token frequencies per hotel and sentiment for the word clouds and top-word tables
+try:
+    with span('load.token_index'):
+        token_index = get_token_index()
+except Exception as e:
+    st.error(f"Error loading data: {e}")
+    token_index = None
+
+# Load the compact model export once per process and warm it up with a dummy prediction
+try:
+    with span('model.warm_up'):
+        warm_up()
+except Exception as e:
+    st.error(f"Error loading model: {e}")
+
+# Charts come from the chart cache or are drawn in a process pool, then streamed into
+# their placeholders as soon as each one is ready
+def show_png(placeholder, png):
+    placeholder.image(png, use_column_width=True)
+
+def show_chart_error(placeholder, e):
+    placeholder.error(f"Error drawing chart: {e}")
+
+chart_pipeline = ChartPipeline(show=show_png, show_error=show_chart_error, cache=chart_cache)
+
+def show_chart(hotel_id, chart_id, draw):
+    # Per-hotel version: an ingest only invalidates the charts of the hotels it added reviews to
+    data_version = review_store.hotel_version(hotel_id) if review_store is not None else None
+    chart_pipeline.submit(st.empty(), hotel_id, chart_id, data_version, draw)
 
 # Function to print hotel information
 def print_hotel_info(hotel_id):
-    info = hotel_info_sorted[hotel_info_sorted['Hotel ID'] == hotel_id]
-    if not info.empty:
-        hotel_name = info['Hotel Name'].values[0]
-        hotel_address = info['Hotel Address'].values[0]
-        hotel_rank = info['Hotel Rank'].values[0]
+    info = review_store.hotel_profile(hotel_id) if review_store is not None else None
+    if info is not None:
+        hotel_name = info['Hotel Name']
+        hotel_address = info['Hotel Address']
+        hotel_rank = info['Hotel Rank']
         st.write(f"**Hotel Name:** {hotel_name}")
         st.write(f"**Hotel Address:** {hotel_address}")
         st.write(f"**Hotel Rank:** {hotel_rank}")
     else:
         st.write(f"No hotel found with ID '{hotel_id}'")
 
-vietnamese_df = pd.read_csv('backup_vn.csv')
-
 # Sidebar for navigation
 with st.sidebar:
     selected = st.selectbox(
         "Select Page",
         ["Business Understanding", "Data Understanding & Data Preparation", "Customer Feedback Classification", "Modeling & Evaluations", "Statistics Providing Insight"]
     )
+tracing.annotate(page=selected)
 
 
 # Page content based on selection
@@ -85,18 +130,42 @@ elif selected == "Data Understanding & Data Preparation":
     """)
     # Display head and tail of the DataFrame
     st.write("### Data Sample")
+    # Only the first and last rows are read from the CSV
+    vietnamese_head, vietnamese_tail = read_sample('backup_vn.csv')
     # Display head
     st.write("**Head of the DataFrame:**")
-    st.write(vietnamese_df.head())
+    st.write(vietnamese_head)
     # Display tail
     st.write("**Tail of the DataFrame:**")
-    st.write(vietnamese_df.tail())
+    st.write(vietnamese_tail)
 
 
 elif selected == "Customer Feedback Classification":
     st.header("Phân loại phản hồi của khách hàng")
     st.write("### Sentiment Analysis Results")
-    st.write("Placeholder for sentiment analysis results")
+    feedback_text = st.text_area("Nhập phản hồi của khách hàng (mỗi dòng một phản hồi):")
+    feedback = [line.strip() for line in feedback_text.splitlines() if line.strip()]
+    if feedback:
+        # Raw reviews are normalized into the Review_new format the model was trained on
+        with span('model.normalize', rows=len(feedback)):
+            feedback_normalized = normalize_batch(feedback)
+        # Scored by the local micro-batching service; falls back to this process if it isn't running
+        with span('model.inference', rows=len(feedback)):
+            try:
+                predictions = request_predictions(feedback_normalized)
+            except OSError:
+                st.warning("Scoring service is not reachable, classifying in the app instead.")
+                predictions = predict_locally(feedback_normalized)
+        feedback_results = pd.DataFrame(predictions['probabilities'], columns=SENTIMENT_LABELS)
+        feedback_results.insert(0, 'Sentiment', predictions['sentiments'])
+        feedback_results.insert(0, 'Review_new', feedback_normalized)
+        feedback_results.insert(0, 'Review', feedback)
+        # Tokens that pushed each review towards and away from its predicted sentiment
+        with span('model.explain', rows=len(feedback)):
+            explanations = explain_texts(feedback_normalized, predictions['labels'])
+        for column in explanations.columns:
+            feedback_results[column] = explanations[column].map(format_terms)
+        st.write(feedback_results)
     st.write("### Word Clouds")
     st.write("Placeholder for word clouds")
 
@@ -104,51 +173,46 @@ elif selected == "Customer Feedback Classification":
 elif selected == "Modeling & Evaluations":
     st.header("Modeling & Evaluations")
 
-    # Load the pre-trained model and vectorizer
-    st.write("Loading the pre-trained logistic regression model and vectorizer...")
-    model = joblib.load('logistic_regression_model.pkl')
-    vectorizer = joblib.load('count_vectorizer.pkl')
-
-    # Load your test data
-    st.write("Loading the test data...")
-    test_data = pd.read_csv('test_data.csv')
-
-    # Handle NaN values by filling them with an empty string
-    st.write("Cleaning the test data...")
-    test_data['Review_new'].fillna('', inplace=True)
-    
-    # Prepare test data for prediction
-    X_test = test_data['Review_new']
-    y_test = test_data['Sentiment']
-    
-    # Transform test data
-    st.write("Transforming the test data using the loaded vectorizer...")
-    test_X = vectorizer.transform(X_test).toarray()
-    
-    # Predict on test data
-    st.write("Predicting on the test data...")
-    preds = model.predict(test_X)
+    # Results are cached on disk, keyed by a content hash of the model, vectorizer and test set;
+    # the test data is only re-scored when one of them changes
+    st.write("Evaluating the pre-trained logistic regression model and vectorizer on the test data...")
+    from evaluation_cache import get_evaluation
+    with span('model.evaluation'):
+        evaluation = get_evaluation()
 
     # Accuracy Score
-    accuracy = accuracy_score(y_test, preds)
     st.subheader("Accuracy Score")
-    st.write(f"Accuracy Score: {accuracy:.4f}")
+    st.write(f"Accuracy Score: {evaluation['accuracy']:.4f}")
     
     # Classification Report
     st.subheader("Classification Report")
-    report = classification_report(y_test, preds, digits=4)
-    st.text(report)
+    st.text(evaluation['report'])
     
     # Confusion Matrix
     st.subheader("Confusion Matrix")
-    cm = confusion_matrix(y_test, preds)
-    
-    fig, ax = plt.subplots()
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', ax=ax)
-    ax.set_xlabel('Predicted')
-    ax.set_ylabel('Actual')
-    ax.set_title('Confusion Matrix')
-    st.pyplot(fig)
+    st.image(evaluation['confusion_matrix_png'])
+
+    # Misclassified reviews of one confusion matrix cell, with the tokens behind each prediction
+    st.subheader("Misclassified Reviews")
+    y_test, preds = evaluation['y_test'], evaluation['preds']
+    errors = pd.Series(list(zip(y_test[y_test != preds], preds[y_test != preds]))).value_counts()
+    if len(errors):
+        actual, predicted = st.selectbox(
+            "Actual → Predicted:", errors.index,
+            format_func=lambda pair: f"{SENTIMENT_LABELS[pair[0]]} → {SENTIMENT_LABELS[pair[1]]} ({errors[pair]} reviews)")
+        # The evaluation keeps the text of every misclassified row, in row order
+        wrong = np.flatnonzero(y_test != preds)
+        in_cell = (y_test[wrong] == actual) & (preds[wrong] == predicted)
+        texts = np.asarray(evaluation['misclassified_texts'], dtype=object)[in_cell]
+        from model_registry import registry
+        from scoring import MODEL_PATH, VECTORIZER_PATH
+        with span('model.explain', rows=len(texts)):
+            explanations = explain_sklearn(registry.get(MODEL_PATH), registry.get(VECTORIZER_PATH), list(texts),
+                                           preds[wrong][in_cell])
+        misclassified = pd.DataFrame({'Review_new': texts})
+        for column in explanations.columns:
+            misclassified[column] = explanations[column].map(format_terms)
+        st.write(misclassified)
 
     # Model Summary
     st.write("""
@@ -161,408 +225,83 @@ elif selected == "Modeling & Evaluations":
 
 elif selected == "Statistics Providing Insight":
     st.header("Thống kê cung cấp insight")
-    # Display Top 10 Hotels
-    st.subheader("Top 10 Hotels")
-    top_hotels = hotel_info_sorted.head(10)
-    st.write(top_hotels[['num', 'Hotel ID', 'Hotel Name', 'Hotel Rank', 'Hotel Address', 'Total Score']])
+    # Display Top Hotels, ranked by the category scores and review sentiment weighted as chosen
+    st.subheader("Top Hotels")
+    try:
+        leaderboard = get_leaderboard(rollup_cube)
+    except Exception as e:
+        st.error(f"Error loading data: {e}")
+        leaderboard = None
+    if leaderboard is not None:
+        with st.expander("Ranking criteria"):
+            weights = {criterion: st.slider(criterion, 0.0, 5.0, DEFAULT_WEIGHTS[criterion], 0.5)
+                       for criterion in ALL_CRITERIA}
+        col1, col2, col3 = st.columns(3)
+        min_stars = col1.selectbox("Minimum stars", [0, 1, 2, 3, 4, 5])
+        cities = col2.multiselect("City", leaderboard.city_names())
+        page = col3.number_input("Page", min_value=1, value=1, step=1)
+        with span('aggregate.leaderboard', rows=len(leaderboard)):
+            top_hotels, total = leaderboard.rank(weights, min_stars, cities, page=page - 1, page_size=10)
+        st.write(top_hotels)
+        st.caption(f"Hotels {min(total, (page - 1) * 10 + 1)}-{min(total, page * 10)} of {total}")
     # User input for Hotel ID
-    # Header 1
-    st.subheader("I. TỔNG QUAN: ")
-    hotel_id = st.text_input("Enter Hotel ID:")
+    # Hotels are looked up by name, address or ID, ignoring case and diacritics
+    query = st.text_input("Search hotel by name, address or Hotel ID:")
+    hotel_id = None
+    if query:
+        with span('filter.hotel_search') as s:
+            search_index = get_search_index()
+            matches = search_index.search(query)
+            s.set_rows(len(matches))
+        if matches:
+            hotel_id = st.selectbox("Select hotel", [match for match, _ in matches],
+                                    format_func=lambda match: f"{match} - {search_index.profiles[match][0]}")
+        else:
+            st.write(f"No hotel found matching '{query}'")
+    tracing.annotate(hotel=hotel_id)
     if hotel_id:
         print_hotel_info(hotel_id)
-        # Filter data_final for the selected hotel_id
-        hotel_data = data_final[data_final['Hotel ID'] == hotel_id]
-        # Head 2
-        st.write("##### Sample Reviews")
-        st.write(hotel_data[['Title', 'Body', 'Sentiment']].head())
-        # Display some basic statistics or information about the filtered data
-        if not hotel_data.empty:
-            # Total number of reviews
-            total_reviews = hotel_data['Sentiment'].count()
-            # Head 2
-            st.write(f"##### 1. Tổng số đánh giá của khách sạn là: {total_reviews}")
-            # Sentiment counts
-            sentiment_counts = hotel_data['Sentiment'].value_counts()
-            # Head 2
-            st.write("##### 2. Phân loại đánh giá của khách hàng:")
-            # Create a table for sentiment counts
-            st.write(sentiment_counts.to_frame().reset_index().rename(columns={'index': 'Sentiment', 'Sentiment': 'Count'}))
-            # Draw a bar chart with different colors for each sentiment
-            # Head 2
-            st.write("##### 3. Sentiment Distribution")
-            st.bar_chart(sentiment_counts, use_container_width=True)
-            # New Section: Score Distribution
-            st.write("##### Thông tin về điểm số đánh giá")
-            # Calculate and display median score
-            median_score = hotel_data['Score'].mean()
-            st.write(f"**Median Score:** {median_score}")
-            # Plot Score Distribution
-            fig, ax = plt.subplots(figsize=(8, 6))
-            sns.histplot(hotel_data['Score'], bins=10, kde=True, color='skyblue', ax=ax)
-            ax.set_title(f'Score Distribution for Hotel {hotel_id}')
-            ax.set_xlabel('Score')
-            ax.set_ylabel('Frequency')
-            # Save the plot to a BytesIO object and display it with Streamlit
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png')
-            buf.seek(0)
-            img = Image.open(buf)
-            st.image(img)
-        else:
+        if review_store is None or not review_store.num_reviews(hotel_id):
             st.write(f"No review data found for Hotel ID '{hotel_id}'")
-
-    def extract_nights(stay_details):
-        # Look for patterns like "X đêm"
-        words = stay_details.split()
-        for i, word in enumerate(words):
-            if word.isdigit() and i < len(words) - 1 and words[i + 1] == 'đêm':
-                return int(word)
-        return None
-    def extract_month_year(stay_details):
-        # Look for patterns like "Tháng X năm YYYY"
-        try:
-            date = parser.parse(stay_details, fuzzy=True)
-            return date.strftime('%B %Y')
-        except:
-            return None
-    hotel_data['Nights Stayed'] = hotel_data['Stay Details'].apply(extract_nights)
-    hotel_data['Month Year'] = hotel_data['Stay Details'].apply(extract_month_year)
-    def convert_to_datetime(month_year_str):
-        try:
-            return datetime.strptime(month_year_str, '%B %Y')
-        except ValueError:
-            return None
-    hotel_data['Date'] = hotel_data['Month Year'].apply(convert_to_datetime)
-    # Additional Insights
-    st.write("##### Tổng quan thời gian lưu trú:")
-    st.write("- Số đêm lưu trú: 'Nights Stayed'")
-    st.write("- Lượng khách lưu trú tăng/giảm giữa các tháng trong năm và qua các năm : 'Distribution of Stays by Month and Year'")
-    # Distribution of Nights Stayed
-    st.write("###### Số đêm lưu trú: 'Nights Stayed'")
-    fig, ax = plt.subplots(figsize=(8, 6))
-    sns.histplot(hotel_data['Nights Stayed'].dropna(), bins=10, kde=True, color='skyblue', ax=ax)
-    ax.set_title('Distribution of Nights Stayed')
-    ax.set_xlabel('Number of Nights')
-    ax.set_ylabel('Frequency')
-    st.pyplot(fig)
-    # Distribution of Stays by Month and Year
-    st.write("###### Lượng khách lưu trú tăng/giảm giữa các tháng trong năm và qua các năm : 'Distribution of Stays by Month and Year'")
-    hotel_data.sort_values(by='Date', inplace=True)
-    fig, ax = plt.subplots(figsize=(12, 8))
-    sns.countplot(x='Date', data=hotel_data, palette='viridis', ax=ax)
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
-    ax.set_title('Distribution of Stays by Month and Year')
-    ax.set_xlabel('Month and Year')
-    ax.set_ylabel('Count')
-    plt.tight_layout()
-    st.pyplot(fig)
-
-    # Head 2
-    st.write("##### Đánh giá theo các mùa trong năm: Sentiment Distribution Throughout the Year")
-    # Extract month and year from the 'Date' column
-    hotel_data['Month'] = hotel_data['Date'].dt.to_period('M')
-    hotel_data['Month'] = hotel_data['Month'].astype(str)  # Convert to string for easier plotting
-    # Group by 'Month' and 'Sentiment', and count occurrences
-    monthly_sentiment_counts = hotel_data.groupby(['Month', 'Sentiment']).size().reset_index(name='Count')
-    # Plot
-    plt.figure(figsize=(14, 8))
-    # Create a line plot to show sentiment distribution throughout the year
-    sns.lineplot(data=monthly_sentiment_counts, x='Month', y='Count', hue='Sentiment', marker='o')
-    # Customize plot
-    plt.title('Sentiment Distribution Throughout the Year')
-    plt.xlabel('Month')
-    plt.ylabel('Number of Reviews')
-    plt.xticks(rotation=45)
-    plt.legend(title='Sentiment')
-    plt.tight_layout()
-    # Show plot
-    st.pyplot(plt)
-
-    # Head 2: Score Distribution Through Month-Year by boxplot
-    st.write("##### Xu hướng điểm số theo thời gian: Score Distribution Through Month-Year by boxplot")
-    # Add a 'Month Year' column for better granularity
-    hotel_data['Month Year'] = hotel_data['Date'].dt.to_period('M')
-    # Create a box plot
-    plt.figure(figsize=(12, 6))
-    sns.boxplot(x='Month Year', y='Score', palette='Set2', data=hotel_data)
-    plt.xticks(rotation=45)
-    plt.title('Score Distribution Through Month-Year by boxplot')
-    plt.xlabel('Month-Year')
-    plt.ylabel('Score')
-    plt.grid(True)
-    st.pyplot(plt)
-
-    # Head 2: Wordcloud for Customer Feedback
-    st.write("#### Wordcloud phản hồi của khách hàng:")
-    st.write("##### Phản hồi tích cực")
-    positive_reviews = hotel_data.loc[hotel_data['Sentiment'] == 'Tích cực', 'Review_new'].values
-    negative_reviews = hotel_data.loc[hotel_data['Sentiment'] == 'Tiêu cực', 'Review_new'].values
-    def generate_wordcloud(reviews, title):
-        wordcloud = WordCloud(width=800, height=400, background_color='white', max_words=50).generate(' '.join(reviews))
-        plt.figure(figsize=(10, 6))
-        plt.imshow(wordcloud, interpolation='bilinear')
-        plt.title(title, fontsize=14)
-        plt.axis('off')
-        st.pyplot(plt)
-    def calculate_word_statistics(wordcloud_text):
-        words = ' '.join(wordcloud_text).split()
-        word_frequency = Counter(words)
-        total_words = len(words)
-        unique_words = len(word_frequency)
-        most_common_words = word_frequency.most_common(10)
-        return word_frequency, total_words, unique_words, most_common_words
-    # Show positive reviews word cloud
-    generate_wordcloud(positive_reviews, 'Word Cloud for Positive Reviews')
-    # Show negative word statistics
-    st.write("###### Top 10 Most Common POSITIVE  Words'")
-    positive_word_frequency, positive_total_words, positive_unique_words, positive_most_common = calculate_word_statistics(positive_reviews)
-    df_positive_most_common = pd.DataFrame(positive_most_common, columns=['Word', 'Count'])
-    st.write(df_positive_most_common)
-    # Filter negative reviews to exclude positive words
-    positive_reviews_set = set(' '.join(positive_reviews).split())
-    def filter_words(review):
-        return ' '.join([word for word in review.split() if word not in positive_reviews_set])
-    negative_reviews_filtered = list(map(filter_words, negative_reviews))
-    # Show negative reviews word cloud
-    st.write("##### Phản hồi 'Tiêu cực'")
-    generate_wordcloud(negative_reviews_filtered, 'Word Cloud for Negative Reviews')
-    # Show negative word statistics
-    st.write("###### Top 10 Most Common NEGATIVE Words'")
-    negative_word_frequency, negative_total_words, negative_unique_words, negative_most_common = calculate_word_statistics(negative_reviews_filtered)
-    df_negative_most_common = pd.DataFrame(negative_most_common, columns=['Word', 'Count'])
-    st.write(df_negative_most_common)
-
-######
-    # Header 1: Nationality Analysis
-    st.subheader("II. PHÂN TÍCH QUỐC TỊCH")
-
-    # Head 2: Nationality Distribution
-    st.write("##### Phân bổ quốc tịch của du khách")
-    nationality_counts = hotel_data['Nationality'].value_counts()
-    fig, ax = plt.subplots(figsize=(10, 6))
-    nationality_counts.plot(kind='bar', color='skyblue', ax=ax)
-    ax.set_title(f'Nationality Distribution for Hotel {hotel_id}')
-    ax.set_xlabel('Nationality')
-    ax.set_ylabel('Count')
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
-    plt.tight_layout()
-    st.pyplot(fig)
-
-    # Head 2: Median Scores by Nationality
-    st.write("##### Điểm số đánh giá trung bình theo quốc tịch")
-    median_scores_by_nationality = hotel_data.groupby('Nationality')['Score'].median().reset_index()
-    median_scores_by_nationality = median_scores_by_nationality.sort_values(by='Score', ascending=False)
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.barplot(x='Nationality', y='Score', data=median_scores_by_nationality, palette='viridis', ax=ax)
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
-    ax.set_xlabel('Nationality')
-    ax.set_ylabel('Median Score')
-    ax.set_title('Median Scores by Nationality')
-    plt.tight_layout()
-    st.pyplot(fig)
-
-    # Head 2: Summary Statistics
-    st.write("##### Bảng tổng hợp thống kê")
-    summary_stats = hotel_data.groupby('Nationality').agg({
-        'Nights Stayed': ['median'],
-        'Sentiment': lambda x: x.value_counts().to_dict()
-    }).reset_index()
-    st.write(summary_stats)
-
-
-######
-    # Header 1:
-    st.subheader("III. PHÂN TÍCH LOẠI PHÒNG")
-
-    # Create a mapping dictionary
-    room_types = hotel_data['Room Type'].unique()
-    mapping_dict = {room_type: f'Type {i+1}' for i, room_type in enumerate(room_types)}
-    # Replace Room Type with generic labels
-    hotel_data['Room Type_new'] = hotel_data['Room Type'].map(mapping_dict)
-
-    # Head 2: with #####
-    st.write("##### Danh sách các loại phòng")
-    unique_room_types = hotel_data[['Room Type', 'Room Type_new']].drop_duplicates().sort_values(by='Room Type_new')
-    st.write(unique_room_types)
-
-    # Head 2: with #####
-    st.write("##### Phân bổ loại phòng được sử dụng giữa các tháng trong năm và qua các năm: Room Type Distribution Throughout the Year")
-    # Extract month and year from the 'Date' column
-    hotel_data['Month'] = hotel_data['Date'].dt.to_period('M')
-    # Aggregate data
-    monthly_room_type_counts = hotel_data.groupby(['Month', 'Room Type_new']).size().reset_index(name='Count')
-    # Plot
-    plt.figure(figsize=(14, 8))
-    ax = sns.barplot(data=monthly_room_type_counts, x='Month', y='Count', hue='Room Type_new', palette='tab20')
-    # Adjust legend
-    plt.legend(title='Room Type_new', bbox_to_anchor=(1.05, 1), loc='upper left', borderaxespad=0.)
-    # Set plot title and labels
-    plt.title('Room Type Distribution Throughout the Year')
-    plt.xlabel('Month')
-    plt.ylabel('Number of Rooms')
-    plt.xticks(rotation=45)
-    # Adjust layout
-    plt.tight_layout()
-    st.pyplot(plt)
-
-    # Head 2: with #####
-    st.write("##### Phân bổ đánh giá của từng loại phòng theo thời gian: Sentiment Trends for Room Type")
-
-
-    # Create a DataFrame that counts sentiments per date and room type
-    sentiment_counts = hotel_data.groupby(['Date', 'Room Type', 'Sentiment']).size().reset_index(name='Count')
-
-    # Pivot table to get the format suitable for plotting
-    sentiment_pivot = sentiment_counts.pivot_table(index=['Date', 'Room Type'],
-                                                columns='Sentiment',
-                                                values='Count',
-                                                fill_value=0).reset_index()
-
-    # Melt the DataFrame for easier plotting
-    sentiment_melted = sentiment_pivot.melt(id_vars=['Date', 'Room Type'],
-                                            value_vars=['Tích cực', 'Tiêu cực', 'Trung tính'],
-                                            var_name='Sentiment',
-                                            value_name='Count')
-
-    # Get unique room types
-    room_types = sentiment_melted['Room Type'].unique()
-    n_room_types = len(room_types)
-    # Calculate number of rows needed for the plots
-    n_cols = 3
-    n_rows = (n_room_types + n_cols - 1) // n_cols  # Ceiling division to handle any remainder
-
-    # Set up the plotting area
-    fig, axes = plt.subplots(nrows=n_rows, ncols=n_cols, figsize=(18, 4 * n_rows))
-
-    # Flatten the axes array for easy iteration
-    axes = axes.flatten()
-
-    # Define the start and end date for the x-axis limits
-    start_date = pd.to_datetime('2022-01-01')
-    end_date = sentiment_melted['Date'].max()
-
-    # Plot data for each room type
-    for ax, room_type in zip(axes, room_types):
-        room_data = sentiment_melted[sentiment_melted['Room Type'] == room_type]
-        sns.lineplot(data=room_data, x='Date', y='Count', hue='Sentiment', ax=ax, marker='o')
-        ax.set_title(f'Sentiment Trends for Room Type: {room_type}')
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Count of Sentiments')
-        ax.legend(title='Sentiment')
-
-        # Set date format and locator
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%y'))
-        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=2))  # Adjust interval as needed
-
-        # Set x-axis limits
-        ax.set_xlim(start_date, end_date)
-
-        # Rotate and align x-axis labels
-        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-
-    # Set x-axis labels for all subplots to ensure consistency
-    for ax in axes:
-        ax.set_xlabel('Date')
-
-    # Hide any unused subplots
-    for ax in axes[len(room_types):]:
-        ax.axis('off')
-
-    plt.tight_layout()
-    st.pyplot(plt)
-
-######
-    # Header 1
-    st.subheader("IV. PHÂN TÍCH NHÓM KHÁCH")
-
-    # Head 2: with #####
-    st.write("##### Phân bổ nhóm khách giữa các tháng và qua các năm: Group Name Distribution Throughout the Year")
-
-    # Extract month and year from the 'Date' column
-    hotel_data['Month'] = hotel_data['Date'].dt.to_period('M')
-
-    # Aggregate data
-    monthly_group_name_counts = hotel_data.groupby(['Month', 'Group Name']).size().reset_index(name='Count')
-
-    # Plot
-    plt.figure(figsize=(14, 8))
-    ax = sns.barplot(data=monthly_group_name_counts, x='Month', y='Count', hue='Group Name', palette='tab20')
-
-    # Adjust legend
-    plt.legend(title='Group Name', bbox_to_anchor=(1.05, 1), loc='upper left', borderaxespad=0.)
-
-    # Set plot title and labels
-    plt.title('Group Name Distribution Throughout the Year')
-    plt.xlabel('Month')
-    plt.ylabel('Number of Rooms')
-    plt.xticks(rotation=45)
-
-    # Adjust layout
-    plt.tight_layout()
-    st.pyplot(plt)
-
-    # Head 2: with #####
-    st.write("##### Phân bổ đánh giá theo từng nhóm khách theo thời gian: Sentiment Trends for Group")
-
-    # Create a DataFrame that counts sentiments per date and group
-    sentiment_counts = hotel_data.groupby(['Date', 'Group Name', 'Sentiment']).size().reset_index(name='Count')
-
-    # Pivot table to get the format suitable for plotting
-    sentiment_pivot = sentiment_counts.pivot_table(index=['Date', 'Group Name'],
-                                                columns='Sentiment',
-                                                values='Count',
-                                                fill_value=0).reset_index()
-
-    # Melt the DataFrame for easier plotting
-    sentiment_melted = sentiment_pivot.melt(id_vars=['Date', 'Group Name'],
-                                            value_vars=['Tích cực', 'Tiêu cực', 'Trung tính'],
-                                            var_name='Sentiment',
-                                            value_name='Count')
-
-    # Get unique group names
-    groups = sentiment_melted['Group Name'].unique()
-    n_groups = len(groups)
-
-    # Calculate number of rows needed for the plots
-    n_cols = 3
-    n_rows = (n_groups + n_cols - 1) // n_cols  # Ceiling division to handle any remainder
-
-    # Set up the plotting area
-    fig, axes = plt.subplots(nrows=n_rows, ncols=n_cols, figsize=(18, 4 * n_rows))
-
-    # Flatten the axes array for easy iteration
-    axes = axes.flatten()
-
-    # Define the start and end date for the x-axis limits
-    start_date = pd.to_datetime('2022-01-01')
-    end_date = sentiment_melted['Date'].max()
-
-    # Plot data for each group
-    for ax, group in zip(axes, groups):
-        group_data = sentiment_melted[sentiment_melted['Group Name'] == group]
-        sns.lineplot(data=group_data, x='Date', y='Count', hue='Sentiment', ax=ax, marker='o')
-        ax.set_title(f'Sentiment Trends for Group: {group}')
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Count of Sentiments')
-        ax.legend(title='Sentiment')
-
-        # Set date format and locator
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%y'))
-        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=2))  # Adjust interval as needed
-
-        # Set x-axis limits
-        ax.set_xlim(start_date, end_date)
-
-        # Rotate and align x-axis labels
-        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-
-    # Hide any unused subplots
-    for ax in axes[len(groups):]:
-        ax.axis('off')
-
-    plt.tight_layout()
-    st.pyplot(plt)
+        else:
+            # Sections I-IV are built by hotel_sections, shared with the offline reports; this
+            # page only displays them
+            with span('aggregate.hotel_sections'):
+                sections = hotel_sections(hotel_id, review_store, rollup_cube, token_index)
+            for title, items in sections:
+                st.subheader(title)
+                for item in items:
+                    if item[0] == 'heading':
+                        st.write(f"##### {item[1]}")
+                    elif item[0] == 'text':
+                        st.write(item[1])
+                    elif item[0] == 'table':
+                        st.write(f"##### {item[1]}")
+                        st.write(item[2])
+                    elif item[0] == 'bar_chart':
+                        st.write(f"##### {item[1]}")
+                        st.bar_chart(item[2], use_container_width=True)
+                    else:
+                        st.write(f"##### {item[1]}")
+                        show_chart(hotel_id, item[2], item[3])
 
 ##### Ending Visualization
 
+# Wait for the charts still being drawn and display them
+chart_pipeline.wait()
+
+# Debug panel: the spans of this run, when tracing is enabled
+if tracing.enabled():
+    spans = pd.DataFrame(tracing.recorder.spans(run=trace_run))
+    with st.sidebar.expander("Debug: timings"):
+        cache_stats = chart_cache.stats()
+        st.write(f"Chart cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                 f"{cache_stats['evictions']} evictions, {cache_stats['entries']} entries "
+                 f"({cache_stats['bytes'] / 2**20:.1f} MiB)")
+        if not spans.empty:
+            spans['duration_ms'] = (spans['duration'] * 1000).round(2)
+            spans['memory_mib'] = (spans['memory'].astype(float) / 2**20).round(2)
+            st.write(f"Total traced: {spans.loc[spans['parent'].isna(), 'duration_ms'].sum():.0f} ms")
+            st.dataframe(spans[[column for column in ['name', 'duration_ms', 'rows', 'memory_mib', 'chart', 'cache', 'parent']
+                                if column in spans.columns]])
+    tracing.flush()
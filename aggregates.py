@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from atomic_files import replacing, write_json
+
+
+# Shared plumbing of the aggregates derived from the review store (rollup cube, token index):
+# row ranges over key-sorted tables, Parquet persistence with a manifest of the store sources
+# an aggregate was built from, incremental deltas for ingested batches, and one shared instance
+# per directory that is rebuilt only when those sources change.
+MANIFEST_FILE = 'manifest.json'
+BASE_FILE = 'base-{}-{}'
+DELTA_FILE = 'delta-{}-{}'
+MAX_DELTAS = 16
+
+
+def row_ranges(*keys):
+    # keys: equal-length arrays sorted together, so every distinct key occupies one contiguous
+    # run of rows. Returns key -> (start, stop); a tuple key when more than one array is given.
+    if len(keys[0]) == 0:
+        return {}
+    changed = np.zeros(len(keys[0]) - 1, dtype=bool)
+    for values in keys:
+        changed |= values[1:] != values[:-1]
+    starts = np.concatenate([[0], np.flatnonzero(changed) + 1])
+    stops = np.concatenate([starts[1:], [len(keys[0])]])
+    labels = keys[0][starts] if len(keys) == 1 else zip(*(values[starts] for values in keys))
+    return {label: (int(start), int(stop)) for label, start, stop in zip(labels, starts, stops)}
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_parquet(frame, path):
+    with replacing(path) as tmp_path:
+        frame.to_parquet(tmp_path, index=False)
+
+
+class PersistedAggregate:
+    # Subclasses set their default DIRECTORY, list their tables in TABLES (attribute -> Parquet
+    # file name suffix), the columns each table's Count is summed over in KEYS and the store columns build()
+    # reads in SOURCE_COLUMNS, and take the tables then the sources in their constructor.
+    #
+    # Every measure is a count, so an ingested batch is persisted as a delta: the aggregate of
+    # just the new rows, written next to the base tables and listed in the manifest. Loading
+    # sums the base and its deltas; once there are more than MAX_DELTAS they are folded into
+    # a new base, as the review store does with its segments. Base and delta files are never
+    # rewritten in place: each is named after the sources it holds and listed in the manifest,
+    # and files the manifest no longer lists are removed once it has been replaced.
+    #
+    # Bump VERSION when build() changes so saved aggregates are rebuilt.
+    VERSION = 1
+    DIRECTORY = None
+    TABLES = {}
+    KEYS = {}
+    SOURCE_COLUMNS = []
+
+    def __init__(self, sources=None):
+        # Sources of the review store the aggregate was built from
+        self.sources = sources
+
+    @classmethod
+    def build(cls, reviews):
+        raise NotImplementedError
+
+    @classmethod
+    def merge(cls, parts, sources=None):
+        # Sum of aggregates over disjoint sets of reviews. Groups keep the order in which their
+        # keys first appear across the parts; a missing key (e.g. the cube's undated month) is a
+        # group of its own.
+        tables = []
+        for attribute in cls.TABLES:
+            table = pd.concat([getattr(part, attribute) for part in parts], ignore_index=True)
+            tables.append(table.groupby(cls.KEYS[attribute], sort=False, dropna=False)['Count'].sum().reset_index())
+        return cls(*tables, sources=sources)
+
+    def save(self, directory=None):
+        # Tables first and the manifest last, so a reader never sees a manifest naming tables
+        # that aren't written yet. The same version and sources always give the same tables, so
+        # they name the base files.
+        directory = directory or self.DIRECTORY
+        os.makedirs(directory, exist_ok=True)
+        digest = _digest([self.VERSION, self.sources])
+        tables = {}
+        for attribute, name in self.TABLES.items():
+            tables[attribute] = BASE_FILE.format(digest, name)
+            _write_parquet(getattr(self, attribute), os.path.join(directory, tables[attribute]))
+        manifest = {'version': self.VERSION, 'sources': self.sources, 'tables': tables, 'deltas': []}
+        write_json(os.path.join(directory, MANIFEST_FILE), manifest)
+        _remove_unlisted(directory, manifest)
+
+    @classmethod
+    def load(cls, directory=None):
+        directory = directory or cls.DIRECTORY
+        manifest = _read_manifest(directory)
+        if manifest is None:
+            raise FileNotFoundError(os.path.join(directory, MANIFEST_FILE))
+        # Manifests written before base files were named list no tables: theirs are TABLES
+        parts = []
+        for files in [manifest.get('tables', cls.TABLES)] + manifest.get('deltas', []):
+            parts.append([os.path.join(directory, files[attribute]) for attribute in cls.TABLES])
+        parts = [cls(*[pd.read_parquet(path) for path in paths]) for paths in parts]
+        if len(parts) == 1:
+            parts[0].sources = manifest['sources']
+            return parts[0]
+        return cls.merge(parts, manifest['sources'])
+
+    @classmethod
+    def append(cls, new_reviews, previous_sources, sources, directory=None):
+        # Persists the aggregate of a batch just appended to the store, moving the saved
+        # aggregate from previous_sources to sources. Costs time in the batch, not the history,
+        # except for the compaction every MAX_DELTAS batches. Returns False, and writes nothing,
+        # when there is no saved aggregate for previous_sources: get_aggregate() builds it.
+        directory = directory or cls.DIRECTORY
+        manifest = _read_manifest(directory)
+        if (manifest is None or manifest.get('version', 1) != cls.VERSION
+                or manifest['sources'] != previous_sources):
+            return False
+        delta = cls.build(new_reviews)
+        # Named after the sources, which are unique to this batch
+        digest = _digest(sources)
+        files = {}
+        for attribute, name in cls.TABLES.items():
+            files[attribute] = DELTA_FILE.format(digest, name)
+            _write_parquet(getattr(delta, attribute), os.path.join(directory, files[attribute]))
+        deltas = manifest.get('deltas', []) + [files]
+        write_json(os.path.join(directory, MANIFEST_FILE), dict(manifest, sources=sources, deltas=deltas))
+        if len(deltas) > MAX_DELTAS:
+            cls.compact(directory)
+        return True
+
+    @classmethod
+    def compact(cls, directory=None):
+        # Folds the deltas into new base tables. The content doesn't change, so neither do the sources.
+        cls.load(directory).save(directory)
+
+
+def _remove_unlisted(directory, manifest):
+    # Tables the manifest no longer lists, including the unnamed base tables of an older
+    # manifest; a reader that loaded the old manifest retries (see get_aggregate). Temp files
+    # (*.tmp) are left to the writers that own them.
+    listed = set(manifest['tables'].values())
+    for delta in manifest['deltas']:
+        listed.update(delta.values())
+    for name in os.listdir(directory):
+        if name.endswith('.parquet') and name not in listed:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+
+def get_aggregate(cls, directory, store):
+    # One instance per (class, directory) shared across sessions. Loaded from disk when saved
+    # for the store's current sources, otherwise built from the store and saved.
+    with _aggregates_lock:
+        entry = _aggregates.setdefault((cls, directory), {'lock': threading.Lock(), 'aggregate': None})
+    with entry['lock']:
+        aggregate = entry['aggregate']
+        if aggregate is not None and aggregate.sources == store.sources:
+            return aggregate
+        aggregate = None
+        manifest = _read_manifest(directory)
+        if manifest is not None and manifest.get('version', 1) == cls.VERSION:
+            try:
+                aggregate = cls.load(directory)
+            except FileNotFoundError:
+                # Compacted between reading the manifest and reading its deltas
+                aggregate = cls.load(directory)
+        if aggregate is None or aggregate.sources != store.sources:
+            aggregate = cls.build(store.table.select(cls.SOURCE_COLUMNS).to_pandas())
+            aggregate.sources = store.sources
+            aggregate.save(directory)
+        entry['aggregate'] = aggregate
+        return aggregate
@@ -0,0 +1,61 @@
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+
+
+# Atomic replacement of the files under .cache and of the generated reports: the new content is
+# written to a temp file of its own next to the target and renamed over it, so a reader sees the
+# old file or the new one, never a partial write, and concurrent writers never share a temp file.
+# Writers that read, modify and replace several files take locked() on their directory.
+
+# mkstemp creates its files 0600; replaced files get the mode open() would have given them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextlib.contextmanager
+def replacing(path):
+    # Yields a fresh temp path in path's directory and replaces path with it when the block
+    # finishes; the temp file is removed instead if the block raises
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=name + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def write_bytes(path, data):
+    with replacing(path) as tmp_path, open(tmp_path, 'wb') as f:
+        f.write(data)
+
+
+def write_text(path, text):
+    with replacing(path) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def write_json(path, value, **kwargs):
+    with replacing(path) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(value, f, **kwargs)
+
+
+@contextlib.contextmanager
+def locked(directory):
+    # Exclusive flock on the directory for the block, across processes and threads. Not
+    # reentrant: a nested locked() of the same directory waits for itself.
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
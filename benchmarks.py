@@ -0,0 +1,392 @@
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from atomic_files import replacing
+from data_loading import read_reviews
+from review_store import HOTEL_ID, PROFILES_PATH, ReviewStore, build_store
+from scoring import LABEL_COLUMN, SENTIMENT_LABELS, TEXT_COLUMN, clean_texts
+from stay_details import clear_cache, parse_stay_details
+from tracing import rss
+
+
+# Benchmarks of the app's data path on synthetic data at multiples of the shipped sizes:
+#   python benchmarks.py --scales 1 10 --output results.json
+#   python benchmarks.py --scales 1 --save-baseline benchmark_baseline.json
+#   python benchmarks.py --scales 1 --baseline benchmark_baseline.json
+# Each stage reports its best wall time over --repeat runs and, from one extra run, its peak
+# traced memory (Python and NumPy allocations, via tracemalloc) and its peak resident memory
+# above the level it started at (sampled; covers Arrow buffers and pandas 3 strings too).
+BENCH_DIR = os.path.join('.cache', 'benchmarks')
+BASELINE_PATH = 'benchmark_baseline.json'
+TOKENS_PATH = 'test_data.csv'
+RESULTS_VERSION = 1
+# Bumped when the generator changes, so cached synthetic data is regenerated
+GENERATOR_VERSION = 1
+
+# data_final.csv and test_data.csv as shipped
+BASE_REVIEWS = 23236
+BASE_TEST_REVIEWS = 9323
+DEFAULT_SCALES = [1, 10, 100]
+GENERATE_CHUNKSIZE = 100000
+
+# Per-hotel stages run over the hotels with the most reviews
+HOTEL_SAMPLE = 20
+WORDCLOUD_HOTELS = 5
+
+# A stage is a regression when it is this much slower than the baseline, and by more than
+# MIN_SLOWDOWN seconds so timer noise on very fast stages doesn't count
+DEFAULT_THRESHOLD = 1.25
+MIN_SLOWDOWN = 0.01
+RSS_SAMPLE_INTERVAL = 0.002  # seconds
+
+NATIONALITIES = ['Việt Nam', 'Hàn Quốc', 'Hoa Kỳ', 'Úc', 'Nhật Bản', 'Trung Quốc', 'Đài Loan', 'Singapore',
+                 'Pháp', 'Vương Quốc Anh', 'Đức', 'Nga', 'Malaysia', 'Thái Lan', 'Canada']
+GROUP_NAMES = ['Cặp đôi', 'Khách lẻ', 'Gia đình có trẻ nhỏ', 'Gia đình có trẻ lớn', 'Nhóm', 'Đi công tác']
+ROOM_TYPES = ['Phòng Deluxe', 'Phòng Superior', 'Phòng Tiêu Chuẩn', 'Phòng Gia Đình', 'Phòng Deluxe Hướng Biển',
+              'Phòng Superior Giường Đôi', 'Phòng 2 Giường Đơn', 'Suite', 'Suite Junior', 'Căn Hộ 1 Phòng Ngủ',
+              'Phòng Premier', 'Biệt Thự']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December']
+# Mean and spread of Score per sentiment
+SCORES = {'Tiêu cực': (5.0, 1.5), 'Trung tính': (7.0, 1.0), 'Tích cực': (9.0, 0.8)}
+# Share of Stay Details in the English month format that goes through the fuzzy date parser
+ENGLISH_STAY_DETAILS = 0.03
+
+
+class ReviewGenerator:
+    # Synthetic reviews with the shipped test set's sentiment mix and, per sentiment, its
+    # review lengths and token frequencies. Hotels are drawn from hotel_profiles.csv with a
+    # long-tailed popularity, so a few hotels have many reviews and most have few.
+    def __init__(self, tokens_path=TOKENS_PATH, profiles_path=PROFILES_PATH, seed=0):
+        self.rng = np.random.default_rng(seed)
+        reviews = pd.read_csv(tokens_path, usecols=[TEXT_COLUMN, LABEL_COLUMN])
+        labels = reviews[LABEL_COLUMN].to_numpy()
+        self.labels, counts = np.unique(labels, return_counts=True)
+        self.label_p = counts / counts.sum()
+        self.lengths = {}
+        self.vocabulary = {}
+        for label in self.labels:
+            tokens = clean_texts(reviews.loc[labels == label, TEXT_COLUMN]).str.split()
+            self.lengths[label] = np.maximum(tokens.map(len).to_numpy(), 1)
+            frequencies = tokens.explode().dropna().value_counts()
+            self.vocabulary[label] = (frequencies.index.to_numpy(dtype=object),
+                                      (frequencies / frequencies.sum()).to_numpy())
+        hotel_ids = pd.read_csv(profiles_path, usecols=[HOTEL_ID], dtype={HOTEL_ID: str})[HOTEL_ID].to_numpy()
+        self.hotel_ids = self.rng.permutation(hotel_ids)
+        weights = 1.0 / np.arange(1, len(hotel_ids) + 1) ** 0.8
+        self.hotel_p = weights / weights.sum()
+
+    def texts(self, labels):
+        texts = np.empty(len(labels), dtype=object)
+        for label in self.labels:
+            rows = np.flatnonzero(labels == label)
+            lengths = self.rng.choice(self.lengths[label], len(rows))
+            words, p = self.vocabulary[label]
+            tokens = words[self.rng.choice(len(words), lengths.sum(), p=p)].tolist()
+            stops = np.cumsum(lengths)
+            texts[rows] = [' '.join(tokens[stop - length:stop]) for stop, length in zip(stops, lengths)]
+        return texts
+
+    def test_data(self, n):
+        labels = self.rng.choice(self.labels, n, p=self.label_p)
+        return pd.DataFrame({TEXT_COLUMN: self.texts(labels), LABEL_COLUMN: labels})
+
+    def reviews(self, n, start=0):
+        # Rows with data_final's columns; Sentiment holds the label names
+        labels = self.rng.choice(self.labels, n, p=self.label_p)
+        sentiments = np.array(SENTIMENT_LABELS, dtype=object)[labels]
+        texts = self.texts(labels)
+        means = np.array([SCORES[sentiment][0] for sentiment in SENTIMENT_LABELS])[labels]
+        spreads = np.array([SCORES[sentiment][1] for sentiment in SENTIMENT_LABELS])[labels]
+        scores = np.clip(self.rng.normal(means, spreads), 1.0, 10.0).round(1)
+        nights = self.rng.integers(1, 8, n)
+        months = self.rng.integers(0, 42, n)
+        month, year = months % 12 + 1, 2021 + months // 12
+        english = self.rng.random(n) < ENGLISH_STAY_DETAILS
+        stay_details = [f'Đã ở {nights_} đêm vào {MONTHS[month_ - 1]} {year_}' if english_ else
+                        f'Đã ở {nights_} đêm vào Tháng {month_} năm {year_}'
+                        for nights_, month_, year_, english_ in zip(nights, month, year, english)]
+        days = self.rng.integers(1, 29, n)
+        review_dates = [f'{day} tháng {month_} năm {year_}' for day, month_, year_ in zip(days, month, year)]
+        return pd.DataFrame({
+            HOTEL_ID: self.rng.choice(self.hotel_ids, n, p=self.hotel_p),
+            'Reviewer Name': [f'Khách {i}' for i in range(start, start + n)],
+            'Nationality': self.rng.choice(NATIONALITIES, n),
+            'Group Name': self.rng.choice(GROUP_NAMES, n),
+            'Room Type': self.rng.choice(ROOM_TYPES, n),
+            'Stay Details': stay_details,
+            'Score': scores,
+            'Title': [' '.join(text.split()[:3]) for text in texts],
+            'Body': texts,
+            'Review Date': review_dates,
+            TEXT_COLUMN: texts,
+            'Sentiment': sentiments,
+        })
+
+
+def generate(scale, data_dir=BENCH_DIR, seed=0, chunksize=GENERATE_CHUNKSIZE):
+    # Writes data_final.csv and test_data.csv for one scale, reusing earlier output when its
+    # manifest matches. Returns the scale's directory.
+    scale_dir = os.path.join(data_dir, f'x{scale}')
+    manifest_path = os.path.join(scale_dir, 'manifest.json')
+    manifest = {'scale': scale, 'seed': seed, 'generator': GENERATOR_VERSION}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            if json.load(f) == manifest:
+                return scale_dir
+        os.remove(manifest_path)
+    os.makedirs(scale_dir, exist_ok=True)
+    generator = ReviewGenerator(seed=seed)
+    for name, total, make in (('data_final.csv', BASE_REVIEWS * scale, generator.reviews),
+                              ('test_data.csv', BASE_TEST_REVIEWS * scale, lambda n, start: generator.test_data(n))):
+        with replacing(os.path.join(scale_dir, name)) as tmp_path:
+            for start in range(0, total, chunksize):
+                make(min(chunksize, total - start), start).to_csv(tmp_path, mode='w' if start == 0 else 'a',
+                                                                  header=start == 0, index=False)
+    # Written last: a partly generated scale is generated again
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return scale_dir
+
+
+class RssSampler:
+    # Highest resident set size seen while active, sampled from a background thread
+    def __enter__(self):
+        self.start = self.peak = rss()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        if self.start is not None:
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._done.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, rss())
+
+    def __exit__(self, *exc):
+        self._done.set()
+        if self.start is not None:
+            self._thread.join()
+            self.peak = max(self.peak, rss())
+
+    def growth(self):
+        return None if self.start is None else self.peak - self.start
+
+
+def measure(run, repeat=1):
+    # Best wall time over `repeat` runs, then one run for the peak memory
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result, rows = run()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with RssSampler() as rss:
+            run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'wall_s': min(times), 'wall_s_runs': times, 'peak_bytes': peak,
+                    'peak_rss_bytes': rss.growth(), 'rows': rows}
+
+
+def stages(scale_dir):
+    # (name, run) pairs in dependency order; run(context) returns (result, rows processed) and
+    # its result is stored in the context under the stage's name for the stages after it
+    import insight_charts
+    from chart_cache import encode_figure
+    from compact_model import get_compact_model
+    from hotel_reports import hotel_sections
+    from model_registry import registry
+    from rollup_cube import SOURCE_COLUMNS as CUBE_COLUMNS, RollupCube
+    from scoring import DEFAULT_BATCH_SIZE, MODEL_PATH, VECTORIZER_PATH, iter_batches, predict
+    from token_index import SOURCE_COLUMNS as TOKEN_COLUMNS, TokenIndex, wordcloud_frequencies
+
+    data_path = os.path.join(scale_dir, 'data_final.csv')
+    store_dir = os.path.join(scale_dir, 'review_store')
+
+    def load_data(context):
+        # The typed read the store is built from, from a cold Stay Details cache
+        clear_cache()
+        reviews = read_reviews(data_path)
+        return reviews, len(reviews)
+
+    def stay_details(context):
+        clear_cache()
+        nights, dates = parse_stay_details(context['load_data']['Stay Details'])
+        return None, len(nights)
+
+    def review_store(context):
+        build_store(data_path, store_dir)
+        store = ReviewStore(store_dir, PROFILES_PATH)
+        context['hotels'] = sorted(store.hotel_ids(), key=store.num_reviews, reverse=True)[:HOTEL_SAMPLE]
+        return store, len(store.table)
+
+    def hotel_filter(context):
+        frames = [context['review_store'].hotel_reviews(hotel_id) for hotel_id in context['hotels']]
+        return None, sum(map(len, frames))
+
+    def rollup_cube(context):
+        reviews = context['review_store'].table.select(CUBE_COLUMNS).to_pandas()
+        return RollupCube.build(reviews), len(reviews)
+
+    def token_index(context):
+        reviews = context['review_store'].table.select(TOKEN_COLUMNS).to_pandas()
+        return TokenIndex.build(reviews), len(reviews)
+
+    def sections(context):
+        # Aggregations of sections I-IV for each hotel, without drawing
+        rows = 0
+        for hotel_id in context['hotels']:
+            hotel_sections(hotel_id, context['review_store'], context['rollup_cube'], context['token_index'])
+            rows += context['review_store'].num_reviews(hotel_id)
+        return None, rows
+
+    def wordcloud(context):
+        words = 0
+        for hotel_id in context['hotels'][:WORDCLOUD_HOTELS]:
+            frequencies = wordcloud_frequencies(context['token_index'].frequencies(hotel_id, 'Tích cực'))
+            if frequencies:
+                encode_figure(insight_charts.wordcloud(frequencies, 'Word Cloud for Positive Reviews'))
+                words += len(frequencies)
+        return None, words
+
+    def test_texts(context):
+        test = pd.read_csv(os.path.join(scale_dir, 'test_data.csv'), usecols=[TEXT_COLUMN])
+        return clean_texts(test[TEXT_COLUMN]), len(test)
+
+    def vectorize_predict(context):
+        # The pickled CountVectorizer and LogisticRegression, as on the Modeling page
+        preds = predict(registry.get(MODEL_PATH), registry.get(VECTORIZER_PATH), context['test_texts'])
+        return None, len(preds)
+
+    def compact_predict(context):
+        # The NumPy export served to the Customer Feedback page and the scoring service
+        model = get_compact_model()
+        rows = sum(len(model.predict(batch.tolist())) for batch in iter_batches(context['test_texts'], DEFAULT_BATCH_SIZE))
+        return None, rows
+
+    return [('load_data', load_data), ('stay_details', stay_details), ('review_store', review_store),
+            ('hotel_filter', hotel_filter), ('rollup_cube', rollup_cube), ('token_index', token_index),
+            ('sections', sections), ('wordcloud', wordcloud), ('test_texts', test_texts),
+            ('vectorize_predict', vectorize_predict), ('compact_predict', compact_predict)]
+
+
+def run_scale(scale, repeat=1, data_dir=BENCH_DIR, seed=0, only=None):
+    scale_dir = generate(scale, data_dir, seed)
+    context = {}
+    results = {}
+    for name, run in stages(scale_dir):
+        # Stages a selected stage depends on still run, once and untimed
+        if only and name not in only:
+            context[name], _ = run(context)
+            continue
+        context[name], results[name] = measure(lambda: run(context), repeat)
+        print(f'x{scale} {name}: {results[name]["wall_s"]:.3f}s, '
+              f'peak {results[name]["peak_bytes"] / 2**20:.1f} MiB traced, '
+              f'{(results[name]["peak_rss_bytes"] or 0) / 2**20:.1f} MiB resident', file=sys.stderr)
+    return {'reviews': BASE_REVIEWS * scale, 'test_reviews': BASE_TEST_REVIEWS * scale, 'stages': results}
+
+
+def environment():
+    import sklearn
+    import pyarrow
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'packages': {'numpy': np.__version__, 'pandas': pd.__version__, 'pyarrow': pyarrow.__version__,
+                     'scikit-learn': sklearn.__version__},
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # Per (scale, stage) present in both: wall time and peak memory ratios to the baseline
+    comparison = []
+    for scale, scale_results in results['scales'].items():
+        baseline_stages = baseline.get('scales', {}).get(scale, {}).get('stages', {})
+        for stage, result in scale_results['stages'].items():
+            if stage not in baseline_stages:
+                continue
+            before = baseline_stages[stage]
+            ratio = result['wall_s'] / before['wall_s'] if before['wall_s'] else float('inf')
+            if ratio > threshold and result['wall_s'] - before['wall_s'] > MIN_SLOWDOWN:
+                status = 'slower'
+            elif ratio < 1 / threshold and before['wall_s'] - result['wall_s'] > MIN_SLOWDOWN:
+                status = 'faster'
+            else:
+                status = 'same'
+            comparison.append({
+                'scale': scale,
+                'stage': stage,
+                'wall_s': result['wall_s'],
+                'baseline_wall_s': before['wall_s'],
+                'wall_ratio': ratio,
+                'peak_bytes': result['peak_bytes'],
+                'baseline_peak_bytes': before['peak_bytes'],
+                'peak_ratio': result['peak_bytes'] / before['peak_bytes'] if before['peak_bytes'] else None,
+                'status': status,
+            })
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the app data path on synthetic data')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help='Multiples of the shipped data_final.csv / test_data.csv sizes')
+    parser.add_argument('--repeat', type=int, default=1, help='Timed runs per stage; the best is reported')
+    parser.add_argument('--stages', nargs='+', help='Only time these stages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=BENCH_DIR, help='Where synthetic data is generated and kept')
+    parser.add_argument('--output', help='Write the JSON results here instead of stdout')
+    parser.add_argument('--baseline', help=f'Compare with these results, e.g. {BASELINE_PATH}; '
+                                           'exits with status 1 if a stage got slower')
+    parser.add_argument('--save-baseline', help='Also write the results here as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Wall time ratio to the baseline that counts as slower')
+    args = parser.parse_args()
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'scales': {str(scale): run_scale(scale, args.repeat, args.data_dir, args.seed, args.stages)
+                   for scale in args.scales},
+    }
+    slower = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            results['comparison'] = compare(results, json.load(f), args.threshold)
+        for row in results['comparison']:
+            print(f'x{row["scale"]} {row["stage"]}: {row["wall_s"]:.3f}s vs {row["baseline_wall_s"]:.3f}s '
+                  f'({row["wall_ratio"]:.2f}x) {row["status"]}', file=sys.stderr)
+        slower = [row for row in results['comparison'] if row['status'] == 'slower']
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(output)
+    if slower:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
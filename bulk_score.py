@@ -0,0 +1,139 @@
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from compact_model import EXPORT_DIR, get_compact_model, warm_up
+from text_normalization import normalize_batch
+from scoring import SENTIMENT_LABELS, TEXT_COLUMN, clean_texts
+
+
+# Re-score a large review dump in chunks across a process pool:
+#   python bulk_score.py reviews.csv predictions.parquet --chunksize 50000 --workers 8
+DEFAULT_CHUNKSIZE = 50000
+
+
+def _init_worker(model_dir):
+    # Each worker memory-maps the same compact export, so the coefficient pages are
+    # shared between workers and no worker has to import sklearn. bulk_score() has seeded
+    # the export already, so this only loads it.
+    warm_up(model_dir)
+
+
+def score_chunk(texts, model_dir=EXPORT_DIR, normalize=False):
+    if normalize:
+        # Raw Body/Title text -> Review_new format
+        texts = normalize_batch(texts, model_dir)
+    model = get_compact_model(model_dir)
+    probas = model.predict_proba(list(texts))
+    return model.classes_[np.argmax(probas, axis=1)], probas
+
+
+def predictions_frame(chunk, labels, probas, keep_columns):
+    result = chunk[keep_columns].reset_index(drop=True) if keep_columns else pd.DataFrame(index=range(len(chunk)))
+    result.insert(0, 'row', chunk.index.to_numpy())
+    result['label'] = labels
+    result['sentiment'] = [SENTIMENT_LABELS[int(label)] for label in labels]
+    for i, name in enumerate(SENTIMENT_LABELS):
+        result[f'proba_{name}'] = probas[:, i]
+    return result
+
+
+class PredictionWriter:
+    # Appends chunks to a CSV or Parquet file, depending on the output extension
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        self._first = True
+
+    def write(self, frame):
+        if self.parquet:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                # The file's schema is fixed by the first chunk
+                table = table.cast(self._writer.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='w' if self._first else 'a', header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def read_chunks(path, chunksize, text_column, keep_columns):
+    usecols = [text_column] + [c for c in keep_columns if c != text_column]
+    # Kept columns are copied as text: inferring their type per chunk would turn a chunk where
+    # one is all empty into floats and change the Parquet schema halfway through the file
+    dtype = {column: str for column in usecols}
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize):
+        # Handle NaN values by filling them with an empty string, as the Modeling page does
+        chunk[text_column] = clean_texts(chunk[text_column]).to_numpy()
+        yield chunk
+
+
+def bulk_score(input_path, output_path, chunksize=DEFAULT_CHUNKSIZE, workers=None, text_column=TEXT_COLUMN,
+               keep_columns=(), model_dir=EXPORT_DIR, normalize=False):
+    workers = workers or os.cpu_count() or 1
+    keep_columns = list(keep_columns)
+    # At most two chunks per worker are in flight, so memory stays flat however long the input is
+    max_in_flight = 2 * workers
+    # Exported (from the pickles, if missing or stale) once here rather than by every worker
+    get_compact_model(model_dir)
+    writer = PredictionWriter(output_path)
+    rows = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_dir,)) as executor:
+        in_flight = deque()
+
+        def write_oldest():
+            chunk, future = in_flight.popleft()
+            labels, probas = future.result()
+            writer.write(predictions_frame(chunk, labels, probas, keep_columns))
+            return len(chunk)
+
+        try:
+            for chunk in read_chunks(input_path, chunksize, text_column, keep_columns):
+                future = executor.submit(score_chunk, chunk[text_column], model_dir, normalize)
+                if text_column not in keep_columns:
+                    chunk = chunk.drop(columns=[text_column])
+                in_flight.append((chunk, future))
+                # Results are written in input order
+                if len(in_flight) >= max_in_flight:
+                    rows += write_oldest()
+            while in_flight:
+                rows += write_oldest()
+        finally:
+            writer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a CSV of reviews with the pre-trained sentiment model')
+    parser.add_argument('input', help='CSV with a review text column')
+    parser.add_argument('output', help='Output file (.csv or .parquet)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--text-column', default=TEXT_COLUMN)
+    parser.add_argument('--keep-columns', default='', help='Comma-separated input columns copied to the output')
+    parser.add_argument('--normalize', action='store_true',
+                        help='Normalize raw review text (e.g. Body) into the Review_new format before scoring')
+    parser.add_argument('--model-dir', default=EXPORT_DIR, help='Compact model export (see compact_model.py)')
+    args = parser.parse_args()
+    keep_columns = [c for c in args.keep_columns.split(',') if c]
+    rows = bulk_score(args.input, args.output, args.chunksize, args.workers, args.text_column, keep_columns,
+                      args.model_dir, args.normalize)
+    print(f'Scored {rows} reviews -> {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+
+# Eviction limits; either can be overridden per deployment through the environment
+MAX_ENTRIES = int(os.environ.get('CHART_CACHE_MAX_ENTRIES', 512))
+MAX_BYTES = int(os.environ.get('CHART_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Same encoding st.pyplot uses, so cached images look like the ones drawn live
+SAVEFIG_KWARGS = {'format': 'png', 'bbox_inches': 'tight', 'dpi': 200}
+
+
+def encode_figure(fig):
+    # pyplot is imported on first use so importing the cache doesn't load it for every page
+    import matplotlib.pyplot as plt
+    buf = io.BytesIO()
+    fig.savefig(buf, **SAVEFIG_KWARGS)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+class ChartCache:
+    # Encoded PNGs keyed by (hotel_id, chart_id, data_version), evicted least recently used
+    # first once either the entry count or the total byte size goes over its limit
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= len(self._entries.pop(key))
+            self._entries[key] = png
+            self.total_bytes += len(png)
+            while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# Process-wide cache shared by all Streamlit sessions
+chart_cache = ChartCache()
@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from chart_cache import chart_cache, encode_figure
+from tracing import record
+
+
+# Worker processes for drawing figures; defaults to one per core
+MAX_WORKERS = int(os.environ.get('CHART_RENDER_WORKERS', os.cpu_count() or 1))
+
+
+def _init_worker():
+    # Headless backend: workers never open a display
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_png(draw):
+    return encode_figure(draw())
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # One pool per server process, shared by every session. Spawned rather than forked so
+    # the workers don't inherit the Streamlit server's threads.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker)
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+class ChartPipeline:
+    # Renders a page's figures concurrently in the process pool. Each chart gets a placeholder
+    # in page order; show(placeholder, png) fills it as soon as that figure is ready, and
+    # show_error(placeholder, error) if drawing it raised, so the rest of the page still renders.
+    def __init__(self, show, show_error, cache=chart_cache):
+        self.show = show
+        self.show_error = show_error
+        self.cache = cache
+        self._pending = {}
+
+    def submit(self, placeholder, hotel_id, chart_id, data_version, draw):
+        key = (hotel_id, chart_id, data_version)
+        started = time.perf_counter()
+        png = self.cache.get(key)
+        if png is not None:
+            self.show(placeholder, png)
+            record('chart.render', time.perf_counter() - started, hotel=hotel_id, chart=chart_id, cache='hit')
+        else:
+            try:
+                future = get_executor().submit(render_png, draw)
+            except BrokenProcessPool:
+                _reset_executor()
+                future = None
+            if future is None:
+                self._render_here(placeholder, key, draw, started)
+            else:
+                self._pending[future] = (placeholder, key, draw, started)
+        # Show whatever has finished in the meantime without blocking the page script
+        self.poll()
+
+    def _finish(self, placeholder, key, png, started):
+        self.cache.put(key, png)
+        self.show(placeholder, png)
+        # From submission to display: queueing in the pool plus drawing and encoding
+        record('chart.render', time.perf_counter() - started, hotel=key[0], chart=key[1], cache='miss')
+
+    def _render_here(self, placeholder, key, draw, started):
+        try:
+            png = render_png(draw)
+        except Exception as e:
+            self.show_error(placeholder, e)
+        else:
+            self._finish(placeholder, key, png, started)
+
+    def _collect(self, futures):
+        for future in futures:
+            placeholder, key, draw, started = self._pending.pop(future)
+            try:
+                png = future.result()
+            except BrokenProcessPool:
+                # A worker died; draw this one in-process and start a fresh pool next time
+                _reset_executor()
+                self._render_here(placeholder, key, draw, started)
+            except Exception as e:
+                self.show_error(placeholder, e)
+            else:
+                self._finish(placeholder, key, png, started)
+
+    def poll(self):
+        self._collect([future for future in self._pending if future.done()])
+
+    def wait(self):
+        # Block until every submitted chart is displayed, in order of completion
+        while self._pending:
+            done, _ = wait(list(self._pending), return_when=FIRST_COMPLETED)
+            self._collect(done)
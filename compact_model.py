@@ -0,0 +1,254 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from atomic_files import locked, replacing, write_json
+from model_registry import MODEL_PATH, VECTORIZER_PATH, file_digest
+from tracing import span
+
+
+# Compact export of count_vectorizer.pkl + logistic_regression_model.pkl and a NumPy-only
+# runtime for it. Serving never unpickles sklearn objects (or imports sklearn at all):
+#   python compact_model.py --check test_data.csv
+# The export is generated, not versioned: get_compact_model() seeds it from the pickles on first
+# use and online_learning.py publishes updated models into it
+EXPORT_DIR = os.path.join('.cache', 'compact_model')
+MANIFEST_FILE = 'manifest.json'
+EXPORT_VERSION = 2
+
+# Arrays of an export, saved as <name>-<content hash>.npy and listed in the manifest:
+#   vocabulary: terms sorted by code point. CountVectorizer numbers its features in the same
+#               order, so a term's position in this array is also its row in coef.
+#   coef: (n_features, n_classes), float64 as trained
+#   intercept, classes
+ARRAYS = ['vocabulary', 'coef', 'intercept', 'classes']
+
+
+def export(model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH, export_dir=EXPORT_DIR):
+    return publish(*_convert(model_path, vectorizer_path), export_dir)
+
+
+def _convert(model_path, vectorizer_path):
+    # The only place the pickles are loaded; joblib/sklearn are imported here, not at module top.
+    # Returns the manifest and arrays to publish.
+    import joblib
+    model = joblib.load(model_path)
+    vectorizer = joblib.load(vectorizer_path)
+    params = vectorizer.get_params()
+    if (params['analyzer'] != 'word' or params['ngram_range'] != (1, 1) or params['tokenizer'] is not None
+            or params['preprocessor'] is not None or params['strip_accents'] is not None
+            or params['stop_words'] is not None or params['binary']):
+        raise ValueError(f'Unsupported vectorizer settings for the compact runtime: {params}')
+
+    terms = sorted(vectorizer.vocabulary_)
+    if any(vectorizer.vocabulary_[term] != i for i, term in enumerate(terms)):
+        raise ValueError('Vectorizer features are not in sorted vocabulary order')
+    n_classes = len(model.classes_)
+    multinomial = n_classes > 2 and getattr(model, 'multi_class', 'auto') != 'ovr' and model.solver != 'liblinear'
+
+    arrays = {
+        'vocabulary': np.array(terms, dtype=str),
+        'coef': model.coef_.T,
+        'intercept': model.intercept_,
+        'classes': model.classes_,
+    }
+    manifest = {
+        'version': EXPORT_VERSION,
+        'token_pattern': params['token_pattern'],
+        'lowercase': params['lowercase'],
+        'proba': 'softmax' if multinomial else 'ovr',
+        'sources': {
+            'model': [model_path, file_digest(model_path)],
+            'vectorizer': [vectorizer_path, file_digest(vectorizer_path)],
+        },
+    }
+    return manifest, arrays
+
+
+def publish(manifest, arrays, export_dir=EXPORT_DIR):
+    # Array files get content-addressed names and the manifest naming them is replaced last, so
+    # a reader loads either the old or the new model, never a mix of both. This is also how an
+    # updated model is swapped in while the app keeps serving. Publishers hold the directory lock,
+    # so one's cleanup never removes the arrays another is about to list.
+    with locked(export_dir):
+        return _publish(manifest, arrays, export_dir)
+
+
+def _publish(manifest, arrays, export_dir):
+    files = dict(manifest.get('files', {}))
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array, dtype=np.float64 if name in ('coef', 'intercept') else None)
+        file_name = f'{name}-{hashlib.sha256(array.tobytes()).hexdigest()[:16]}.npy'
+        path = os.path.join(export_dir, file_name)
+        if not os.path.exists(path):
+            with replacing(path) as tmp_path, open(tmp_path, 'wb') as f:
+                np.save(f, array, allow_pickle=False)
+        files[name] = file_name
+    manifest = dict(manifest, files=files)
+    write_json(os.path.join(export_dir, MANIFEST_FILE), manifest, ensure_ascii=False, indent=1)
+    # Arrays no longer listed; processes that still have them mapped keep their copy
+    for name in os.listdir(export_dir):
+        if name.endswith('.npy') and name not in files.values():
+            try:
+                os.remove(os.path.join(export_dir, name))
+            except OSError:
+                pass
+    return manifest
+
+
+class CompactModel:
+    # Tokenizes like the CountVectorizer, looks terms up by binary search over the sorted
+    # vocabulary and accumulates X @ coef.T in the same order scipy's CSR product does,
+    # so scores (and therefore predictions) are bit-identical to sklearn's
+    def __init__(self, export_dir=EXPORT_DIR, mmap_mode='r'):
+        self.manifest = _manifest(os.path.join(export_dir, MANIFEST_FILE))
+        if self.manifest.get('version') != EXPORT_VERSION:
+            raise ValueError(f'{export_dir} was exported by an incompatible version')
+        files = {name: os.path.join(export_dir, file_name) for name, file_name in self.manifest['files'].items()}
+        self.vocabulary = np.load(files['vocabulary'], mmap_mode=mmap_mode)
+        self.coef = np.load(files['coef'], mmap_mode=mmap_mode)
+        self.intercept = np.load(files['intercept'])
+        self.classes_ = np.load(files['classes'])
+        self.token_pattern = re.compile(self.manifest['token_pattern'])
+        self.lowercase = self.manifest['lowercase']
+        # Identifies this export, e.g. for caches keyed on the model version
+        self.digest = hashlib.sha256(json.dumps([self.manifest['sources'], self.manifest['files']],
+                                                sort_keys=True).encode()).hexdigest()
+
+    def tokenize(self, text):
+        if not isinstance(text, str):
+            text = '' if text is None or text != text else str(text)
+        return self.token_pattern.findall(text.lower() if self.lowercase else text)
+
+    def counts(self, texts):
+        # Sparse counts as (row, column, count) triples, sorted by row then column like a CSR matrix
+        tokens = [self.tokenize(text) for text in texts]
+        lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+        flat = [token for doc in tokens for token in doc]
+        # Casting to the vocabulary's fixed-width dtype truncates longer tokens, which could then
+        # match a term they merely start with; a token wider than every term is never a term
+        fits = np.fromiter(map(len, flat), dtype=np.int64, count=len(flat)) <= self.vocabulary.dtype.itemsize // 4
+        flat = np.array(flat, dtype=self.vocabulary.dtype)
+        rows = np.repeat(np.arange(len(tokens)), lengths)
+        columns = np.searchsorted(self.vocabulary, flat)
+        columns[columns == len(self.vocabulary)] = 0
+        known = (self.vocabulary[columns] == flat) & fits
+        keys, counts = np.unique(rows[known] * len(self.vocabulary) + columns[known], return_counts=True)
+        return keys // len(self.vocabulary), keys % len(self.vocabulary), counts
+
+    def decision_function(self, texts):
+        with span('model.predict', rows=len(texts)):
+            rows, columns, counts = self.counts(texts)
+            scores = np.zeros((len(texts), self.coef.shape[1]))
+            if len(rows):
+                # k-th stored entry of every row is added in step k, one row-wise pass at a time
+                starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+                position = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+                for k in range(position.max() + 1):
+                    at = position == k
+                    scores[rows[at]] += counts[at][:, None] * self.coef[columns[at]]
+            return scores + self.intercept
+
+    def predict(self, texts):
+        return self.classes_[np.argmax(self.decision_function(texts), axis=1)]
+
+    def predict_proba(self, texts):
+        scores = self.decision_function(texts)
+        if self.manifest['proba'] == 'softmax':
+            scores -= scores.max(axis=1, keepdims=True)
+            np.exp(scores, out=scores)
+        else:
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def is_current(self):
+        # False when one of the source pickles next to the export has changed since
+        for path, digest in self.manifest['sources'].values():
+            if os.path.exists(path) and file_digest(path) != digest:
+                return False
+        return True
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _manifest(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _needs_export(manifest_path):
+    return not os.path.exists(manifest_path) or _manifest(manifest_path).get('version') != EXPORT_VERSION
+
+
+def _export_once(export_dir, check, model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH):
+    # At a cold start several processes find the export missing at once: the first one to take
+    # the lock exports, the others wait for it and then find check() false
+    with locked(export_dir):
+        if check():
+            _publish(*_convert(model_path, vectorizer_path), export_dir)
+
+
+def get_compact_model(export_dir=EXPORT_DIR):
+    # One runtime per process; exported on first use, and re-exported if the pickles changed
+    with _models_lock:
+        entry = _models.get(export_dir)
+        manifest_path = os.path.join(export_dir, MANIFEST_FILE)
+        stat = os.stat(manifest_path) if os.path.exists(manifest_path) else None
+        if entry is not None and stat is not None and entry[0] == (stat.st_mtime_ns, stat.st_size):
+            return entry[1]
+        if stat is None or _needs_export(manifest_path):
+            _export_once(export_dir, lambda: _needs_export(manifest_path))
+        try:
+            model = CompactModel(export_dir)
+        except FileNotFoundError:
+            # A new model was published between reading the manifest and loading its arrays
+            model = CompactModel(export_dir)
+        if not model.is_current():
+            sources = model.manifest['sources']
+            _export_once(export_dir, lambda: not CompactModel(export_dir).is_current(),
+                         sources['model'][0], sources['vectorizer'][0])
+            model = CompactModel(export_dir)
+        stat = os.stat(manifest_path)
+        _models[export_dir] = ((stat.st_mtime_ns, stat.st_size), model)
+        return model
+
+
+def warm_up(export_dir=EXPORT_DIR):
+    # Touch the mapped arrays and compile the token pattern before the first real request
+    model = get_compact_model(export_dir)
+    model.predict([''])
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the pickled model to the compact NumPy format')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--vectorizer', default=VECTORIZER_PATH)
+    parser.add_argument('--out', default=EXPORT_DIR)
+    parser.add_argument('--check', metavar='CSV', help='Compare predictions with sklearn on this CSV (e.g. test_data.csv)')
+    args = parser.parse_args()
+    manifest = export(args.model, args.vectorizer, args.out)
+    print(f'Exported {args.model} + {args.vectorizer} -> {args.out} ({manifest["proba"]})')
+    if args.check:
+        import joblib
+        import pandas as pd
+        from scoring import TEXT_COLUMN, clean_texts
+        texts = clean_texts(pd.read_csv(args.check, usecols=[TEXT_COLUMN])[TEXT_COLUMN])
+        model = CompactModel(args.out)
+        expected = joblib.load(args.model).predict(joblib.load(args.vectorizer).transform(texts))
+        mismatches = int(np.sum(model.predict(texts) != expected))
+        print(f'{len(texts) - mismatches}/{len(texts)} predictions identical to sklearn')
+        if mismatches:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
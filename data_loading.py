@@ -0,0 +1,62 @@
+import os
+from collections import deque
+
+import pandas as pd
+
+from stay_details import parse_stay_details
+from tracing import span
+
+
+# Low-cardinality text columns of data_final, held as pandas categoricals
+CATEGORICAL_COLUMNS = ['Hotel ID', 'Nationality', 'Room Type', 'Group Name', 'Sentiment', 'Stay Details']
+FLOAT_COLUMNS = ['Score']
+
+
+def to_float(values):
+    # Scores may come as comma-decimal strings ("8,8")
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        values = values.astype(str).str.replace(',', '.', regex=False)
+    return pd.to_numeric(values, errors='coerce', downcast='float')
+
+
+def apply_types(df):
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    for column in FLOAT_COLUMNS:
+        if column in df.columns:
+            df[column] = to_float(df[column])
+    if 'Stay Details' in df.columns:
+        df['Nights Stayed'], df['Date'] = parse_stay_details(df['Stay Details'])
+    return df
+
+
+def read_reviews(path, **kwargs):
+    # Typed read of data_final: categoricals, float32 Score and pre-parsed stay dates
+    with span('load.read_reviews') as s:
+        df = pd.read_csv(path, dtype={column: 'category' for column in CATEGORICAL_COLUMNS}, **kwargs)
+        s.set_rows(len(df))
+        return apply_types(df)
+
+
+_samples = {}
+
+
+def read_sample(path, n=5):
+    # Head and tail of a CSV without keeping the whole file resident: the head comes from
+    # the first rows, the tail from a chunked pass that keeps only the last n rows
+    stat = os.stat(path)
+    key = (path, n)
+    cached = _samples.get(key)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
+    head = pd.read_csv(path, nrows=n)
+    tail_chunks = deque(maxlen=n)
+    offset = 0
+    for chunk in pd.read_csv(path, chunksize=max(n, 10000)):
+        chunk.index = range(offset, offset + len(chunk))
+        offset += len(chunk)
+        tail_chunks.append(chunk.tail(n))
+    tail = pd.concat(tail_chunks).tail(n) if tail_chunks else head.iloc[0:0]
+    _samples[key] = ((stat.st_mtime_ns, stat.st_size), (head, tail))
+    return head, tail
@@ -0,0 +1,142 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import matplotlib.pyplot as plt
+import numpy as np
+import seaborn as sns
+from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+
+from model_registry import cached_file_digest, registry
+from scoring import MODEL_PATH, VECTORIZER_PATH, DEFAULT_BATCH_SIZE, score_csv
+from tracing import span
+
+
+TEST_DATA_PATH = 'test_data.csv'
+CACHE_DIR = os.path.join('.cache', 'evaluation')
+
+# In-process copy of the entries already read from disk
+_memory = {}
+
+
+def evaluation_key(model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH, test_path=TEST_DATA_PATH):
+    # Content hash of the three inputs; any change to an artifact gives a new key
+    digest = hashlib.sha256()
+    for path in (model_path, vectorizer_path, test_path):
+        digest.update(cached_file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def render_confusion_matrix(cm):
+    fig, ax = plt.subplots()
+    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', ax=ax)
+    ax.set_xlabel('Predicted')
+    ax.set_ylabel('Actual')
+    ax.set_title('Confusion Matrix')
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def compute_evaluation(model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH, test_path=TEST_DATA_PATH,
+                       batch_size=DEFAULT_BATCH_SIZE):
+    model = registry.get(model_path)
+    vectorizer = registry.get(vectorizer_path)
+    with span('model.score_test_set') as s:
+        # Review text of the misclassified rows is collected chunk by chunk, for the Modeling
+        # page's drill-down
+        y_test, preds, misclassified_texts = score_csv(test_path, model, vectorizer, batch_size=batch_size)
+        s.set_rows(len(preds))
+    cm = confusion_matrix(y_test, preds)
+    return {
+        'y_test': y_test,
+        'preds': preds,
+        'accuracy': float(accuracy_score(y_test, preds)),
+        'report': classification_report(y_test, preds, digits=4),
+        'confusion_matrix': cm,
+        'confusion_matrix_png': render_confusion_matrix(cm),
+        'misclassified_texts': misclassified_texts,
+    }
+
+
+def _save(entry_dir, result):
+    # A private directory per writer: sessions computing the same entry at once don't share it
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix=os.path.basename(entry_dir) + '.',
+                               suffix='.tmp')
+    np.save(os.path.join(tmp_dir, 'y_test.npy'), result['y_test'])
+    np.save(os.path.join(tmp_dir, 'preds.npy'), result['preds'])
+    np.save(os.path.join(tmp_dir, 'confusion_matrix.npy'), result['confusion_matrix'])
+    with open(os.path.join(tmp_dir, 'confusion_matrix.png'), 'wb') as f:
+        f.write(result['confusion_matrix_png'])
+    with open(os.path.join(tmp_dir, 'metrics.json'), 'w', encoding='utf-8') as f:
+        json.dump({'accuracy': result['accuracy'], 'report': result['report']}, f, ensure_ascii=False)
+    with open(os.path.join(tmp_dir, 'misclassified.json'), 'w', encoding='utf-8') as f:
+        json.dump(result['misclassified_texts'], f, ensure_ascii=False)
+    if os.path.isdir(entry_dir) and not _is_loadable(entry_dir):
+        # A stale entry, e.g. one cached before misclassified.json was: replaced by this one
+        _discard(entry_dir)
+    # Publish the entry in one step so a concurrent reader never sees a partial one
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # Another worker published the same entry first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _discard(entry_dir):
+    # Moved aside first, so the entry's name is free as soon as the rename is done
+    stale_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix=os.path.basename(entry_dir) + '.',
+                                 suffix='.stale')
+    try:
+        os.replace(entry_dir, os.path.join(stale_dir, 'entry'))
+    except OSError:
+        # Another worker moved it already
+        pass
+    shutil.rmtree(stale_dir, ignore_errors=True)
+
+
+def _load(entry_dir):
+    with open(os.path.join(entry_dir, 'metrics.json'), encoding='utf-8') as f:
+        metrics = json.load(f)
+    with open(os.path.join(entry_dir, 'confusion_matrix.png'), 'rb') as f:
+        png = f.read()
+    with open(os.path.join(entry_dir, 'misclassified.json'), encoding='utf-8') as f:
+        misclassified_texts = json.load(f)
+    return {
+        'y_test': np.load(os.path.join(entry_dir, 'y_test.npy'), allow_pickle=True),
+        'preds': np.load(os.path.join(entry_dir, 'preds.npy'), allow_pickle=True),
+        'accuracy': metrics['accuracy'],
+        'report': metrics['report'],
+        'confusion_matrix': np.load(os.path.join(entry_dir, 'confusion_matrix.npy')),
+        'confusion_matrix_png': png,
+        'misclassified_texts': misclassified_texts,
+    }
+
+
+def _is_loadable(entry_dir):
+    try:
+        _load(entry_dir)
+    except (OSError, ValueError, KeyError):
+        return False
+    return True
+
+
+def get_evaluation(model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH, test_path=TEST_DATA_PATH,
+                   cache_dir=CACHE_DIR):
+    key = evaluation_key(model_path, vectorizer_path, test_path)
+    if key in _memory:
+        return _memory[key]
+    entry_dir = os.path.join(cache_dir, key)
+    try:
+        result = _load(entry_dir)
+    except (OSError, ValueError, KeyError):
+        result = compute_evaluation(model_path, vectorizer_path, test_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        _save(entry_dir, result)
+    _memory.clear()
+    _memory[key] = result
+    return result
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from compact_model import EXPORT_DIR, get_compact_model
+from scoring import transform_batch
+
+
+# Which tokens drove a prediction. With a linear model over token counts a review's class score
+# is the sum of count x coefficient over its tokens, so the per-token products are an exact
+# decomposition of the decision. All reviews of a batch are explained in one vectorized pass
+# over the sparse (row, column, count) entries.
+DEFAULT_TOP_K = 5
+
+
+def centered_weights(weights):
+    # (n_features, n_classes) coefficients minus each feature's mean over the classes. Softmax
+    # probabilities don't change when every class score moves by the same amount, so only this
+    # part of a coefficient favours one class over the others.
+    weights = np.asarray(weights, dtype=np.float64)
+    return weights - weights.mean(axis=1, keepdims=True)
+
+
+def explain_counts(rows, columns, counts, n_rows, weights, labels, terms, k=DEFAULT_TOP_K):
+    # rows/columns/counts: sparse entries sorted by row. labels: class position explained for
+    # each row, usually the predicted one. Returns the k terms pushing most towards that class
+    # and the k pushing most against it, as (term, contribution) lists.
+    rows = np.asarray(rows, dtype=np.int64)
+    columns = np.asarray(columns, dtype=np.int64)
+    contributions = np.asarray(counts, dtype=np.float64) * centered_weights(weights)[columns, np.asarray(labels)[rows]]
+    # Each row's entries from the largest contribution to the smallest
+    order = np.lexsort((-contributions, rows))
+    rows, columns, contributions = rows[order], columns[order], contributions[order]
+    starts = np.searchsorted(rows, np.arange(n_rows))
+    stops = np.searchsorted(rows, np.arange(n_rows), side='right')
+    from_start = np.arange(len(rows)) - starts[rows]
+    from_end = stops[rows] - 1 - np.arange(len(rows))
+    positive = [[] for _ in range(n_rows)]
+    negative = [[] for _ in range(n_rows)]
+    for i in np.flatnonzero((from_start < k) & (contributions > 0)):
+        positive[rows[i]].append((str(terms[columns[i]]), float(contributions[i])))
+    # Most negative first
+    for i in np.flatnonzero((from_end < k) & (contributions < 0))[::-1]:
+        negative[rows[i]].append((str(terms[columns[i]]), float(contributions[i])))
+    for terms_against in negative:
+        terms_against.sort(key=lambda term: term[1])
+    return pd.DataFrame({'Positive terms': positive, 'Negative terms': negative})
+
+
+def explain_matrix(X, weights, labels, terms, k=DEFAULT_TOP_K):
+    # X: CSR count matrix from the CountVectorizer; weights: model.coef_.T
+    X = X.tocsr()
+    X.sort_indices()
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+    return explain_counts(rows, X.indices, X.data, X.shape[0], weights, labels, terms, k)
+
+
+def explain_texts(texts, labels=None, k=DEFAULT_TOP_K, export_dir=EXPORT_DIR):
+    # Explanations from the served compact model; labels default to its predictions
+    model = get_compact_model(export_dir)
+    texts = list(texts)
+    if labels is None:
+        labels = np.argmax(model.decision_function(texts), axis=1)
+    else:
+        labels = np.searchsorted(model.classes_, labels)
+    rows, columns, counts = model.counts(texts)
+    return explain_counts(rows, columns, counts, len(texts), model.coef, labels, model.vocabulary, k)
+
+
+def explain_sklearn(model, vectorizer, texts, labels, k=DEFAULT_TOP_K):
+    # Same explanations from the pickled vectorizer and logistic regression
+    return explain_matrix(transform_batch(vectorizer, texts), model.coef_.T, np.searchsorted(model.classes_, labels),
+                          vectorizer.get_feature_names_out(), k)
+
+
+def format_terms(terms):
+    return ', '.join(f'{term} ({contribution:+.2f})' for term, contribution in terms)
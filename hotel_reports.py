@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from atomic_files import write_bytes, write_json, write_text
+from chart_cache import encode_figure
+from chart_pipeline import _init_worker
+from review_store import get_store
+from rollup_cube import get_cube
+from token_index import get_token_index, wordcloud_frequencies
+from tracing import span
+
+
+# Offline "Statistics Providing Insight" reports, one static HTML page + PNGs per hotel:
+#   python hotel_reports.py --out reports
+# Hotels are fanned out over a process pool. Each hotel directory gets a report.json stamp
+# written last, so an interrupted run resumes where it stopped and hotels whose reviews and
+# profile haven't changed since their report was built are skipped.
+REPORT_DIR = 'reports'
+STAMP_FILE = 'report.json'
+PAGE_FILE = 'index.html'
+# Bumped when the report layout changes, so every report is rebuilt
+REPORT_VERSION = 2
+MAX_WORKERS = int(os.environ.get('REPORT_WORKERS', os.cpu_count() or 1))
+
+PROFILE_FIELDS = ['Hotel Name', 'Hotel Address', 'Hotel Rank']
+SAMPLE_REVIEWS = 5
+TOP_WORDS = 10
+
+
+def hotel_dir_name(hotel_id):
+    return re.sub(r'[^\w.-]', '_', str(hotel_id))
+
+
+def report_version(store, hotel_id):
+    # The hotel's review version plus the profile fields shown in the report
+    profile = store.hotel_profile(hotel_id) or {}
+    key = json.dumps([REPORT_VERSION, store.hotel_version(hotel_id),
+                      [str(profile.get(field, '')) for field in PROFILE_FIELDS]])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def _read_stamp(hotel_dir):
+    path = os.path.join(hotel_dir, STAMP_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_current(out_dir, store, hotel_id):
+    stamp = _read_stamp(os.path.join(out_dir, hotel_dir_name(hotel_id)))
+    return stamp is not None and stamp.get('version') == report_version(store, hotel_id)
+
+
+def hotel_sections(hotel_id, store, cube, token_index):
+    # Everything the insight page shows for one hotel, as (title, items) sections; the page and
+    # the offline reports only display them. Items are ('heading', str), ('text', str),
+    # ('table', caption, frame), ('bar_chart', caption, series) or
+    # ('chart', caption, chart_id, draw), where draw() returns the matplotlib figure.
+    import insight_charts
+    hotel_data = store.hotel_reviews(hotel_id)
+    hotel_data.sort_values(by='Date', inplace=True)
+    with span('aggregate.sentiment_counts', rows=len(hotel_data)):
+        sentiment_counts = hotel_data['Sentiment'].value_counts()
+
+    overview = [
+        ('table', 'Sample Reviews', hotel_data[['Title', 'Body', 'Sentiment']].head(SAMPLE_REVIEWS)),
+        ('heading', f"1. Tổng số đánh giá của khách sạn là: {hotel_data['Sentiment'].count()}"),
+        ('table', '2. Phân loại đánh giá của khách hàng:', sentiment_counts.rename('Count').reset_index()),
+        ('bar_chart', '3. Sentiment Distribution', sentiment_counts),
+        ('heading', 'Thông tin về điểm số đánh giá'),
+        ('text', f"Median Score: {hotel_data['Score'].mean()}"),
+        ('chart', 'Score Distribution', 'score_distribution',
+         partial(insight_charts.score_distribution, hotel_id, hotel_data['Score'])),
+        # 'Nights Stayed' and 'Date' are parsed from 'Stay Details' once, when the review store is built
+        ('heading', 'Tổng quan thời gian lưu trú:'),
+        ('text', "- Số đêm lưu trú: 'Nights Stayed'"),
+        ('text', "- Lượng khách lưu trú tăng/giảm giữa các tháng trong năm và qua các năm : "
+                 "'Distribution of Stays by Month and Year'"),
+        ('chart', "Số đêm lưu trú: 'Nights Stayed'", 'nights_stayed',
+         partial(insight_charts.nights_stayed, hotel_data['Nights Stayed'])),
+        ('chart', "Lượng khách lưu trú tăng/giảm giữa các tháng trong năm và qua các năm : "
+                  "'Distribution of Stays by Month and Year'", 'stays_by_month',
+         partial(insight_charts.stays_by_month, cube.stays_by_month(hotel_id))),
+    ]
+    # Monthly aggregates are sliced from the precomputed rollup cube
+    monthly_sentiment_counts = cube.monthly_sentiment_counts(hotel_id)
+    monthly_sentiment_counts['Month'] = monthly_sentiment_counts['Month'].dt.to_period('M').astype(str)
+    with span('aggregate.score_box_stats'):
+        score_box_stats = cube.score_box_stats(hotel_id)
+    overview.append(('chart', 'Đánh giá theo các mùa trong năm: Sentiment Distribution Throughout the Year',
+                     'sentiment_by_month', partial(insight_charts.sentiment_by_month, monthly_sentiment_counts)))
+    # No box to draw when none of the hotel's reviews has a parseable date
+    if score_box_stats:
+        overview.append(('chart', 'Xu hướng điểm số theo thời gian: Score Distribution Through Month-Year by boxplot',
+                         'score_boxplot', partial(insight_charts.score_boxplot, score_box_stats)))
+    overview.append(('heading', 'Wordcloud phản hồi của khách hàng:'))
+    # Token counts per hotel and sentiment come from the token-frequency index
+    with span('aggregate.word_frequencies'):
+        positive_frequencies = wordcloud_frequencies(token_index.frequencies(hotel_id, 'Tích cực'))
+        # Negative words that never appear in positive reviews
+        negative_frequencies = wordcloud_frequencies(token_index.frequencies(hotel_id, 'Tiêu cực', exclude='Tích cực'))
+    # A word cloud needs at least one word left after its own filtering
+    if positive_frequencies:
+        overview.append(('chart', 'Phản hồi tích cực', 'wordcloud_positive',
+                         partial(insight_charts.wordcloud, positive_frequencies, 'Word Cloud for Positive Reviews')))
+    overview.append(('table', 'Top 10 Most Common POSITIVE Words', token_index.top_k(hotel_id, 'Tích cực', TOP_WORDS)))
+    if negative_frequencies:
+        overview.append(('chart', "Phản hồi 'Tiêu cực'", 'wordcloud_negative',
+                         partial(insight_charts.wordcloud, negative_frequencies, 'Word Cloud for Negative Reviews')))
+    overview.append(('table', 'Top 10 Most Common NEGATIVE Words',
+                     token_index.top_k(hotel_id, 'Tiêu cực', TOP_WORDS, exclude='Tích cực')))
+
+    with span('aggregate.nationality', rows=len(hotel_data)):
+        median_scores_by_nationality = hotel_data.groupby('Nationality', observed=True)['Score'].median().reset_index()
+        median_scores_by_nationality = median_scores_by_nationality.sort_values(by='Score', ascending=False)
+        # Sentiment is categorical; aggregate it as plain strings so the per-group dicts aren't cast back to categories
+        summary_stats = hotel_data.astype({'Sentiment': str}).groupby('Nationality', observed=True).agg({
+            'Nights Stayed': ['median'],
+            'Sentiment': lambda x: x.value_counts().to_dict()
+        }).reset_index()
+    nationality = [
+        ('chart', 'Phân bổ quốc tịch của du khách', 'nationality_distribution',
+         partial(insight_charts.nationality_distribution, hotel_id, hotel_data['Nationality'].value_counts())),
+        ('chart', 'Điểm số đánh giá trung bình theo quốc tịch', 'median_score_by_nationality',
+         partial(insight_charts.median_score_by_nationality, median_scores_by_nationality)),
+        ('table', 'Bảng tổng hợp thống kê', summary_stats),
+    ]
+
+    # Room types get generic labels
+    room_types = hotel_data['Room Type'].unique()
+    mapping_dict = {room_type: f'Type {i+1}' for i, room_type in enumerate(room_types)}
+    hotel_data['Room Type_new'] = hotel_data['Room Type'].map(mapping_dict)
+    monthly_room_type_counts = cube.dimension_counts(hotel_id, 'Room Type')
+    monthly_room_type_counts['Month'] = monthly_room_type_counts['Month'].dt.to_period('M')
+    monthly_room_type_counts['Room Type_new'] = monthly_room_type_counts['Room Type'].map(mapping_dict)
+    room_type = [
+        ('table', 'Danh sách các loại phòng',
+         hotel_data[['Room Type', 'Room Type_new']].drop_duplicates().sort_values(by='Room Type_new')),
+        ('chart', 'Phân bổ loại phòng được sử dụng giữa các tháng trong năm và qua các năm: '
+                  'Room Type Distribution Throughout the Year', 'room_type_by_month',
+         partial(insight_charts.monthly_counts, monthly_room_type_counts, 'Room Type_new',
+                 'Room Type Distribution Throughout the Year')),
+        ('chart', 'Phân bổ đánh giá của từng loại phòng theo thời gian: Sentiment Trends for Room Type',
+         'room_type_sentiment_trends',
+         partial(insight_charts.sentiment_trends, cube.sentiment_trends(hotel_id, 'Room Type'), 'Room Type',
+                 'Sentiment Trends for Room Type')),
+    ]
+
+    monthly_group_name_counts = cube.dimension_counts(hotel_id, 'Group Name')
+    monthly_group_name_counts['Month'] = monthly_group_name_counts['Month'].dt.to_period('M')
+    group = [
+        ('chart', 'Phân bổ nhóm khách giữa các tháng và qua các năm: Group Name Distribution Throughout the Year',
+         'group_by_month',
+         partial(insight_charts.monthly_counts, monthly_group_name_counts, 'Group Name',
+                 'Group Name Distribution Throughout the Year')),
+        ('chart', 'Phân bổ đánh giá theo từng nhóm khách theo thời gian: Sentiment Trends for Group',
+         'group_sentiment_trends',
+         partial(insight_charts.sentiment_trends, cube.sentiment_trends(hotel_id, 'Group Name'), 'Group Name',
+                 'Sentiment Trends for Group')),
+    ]
+    return [('I. TỔNG QUAN', overview), ('II. PHÂN TÍCH QUỐC TỊCH', nationality),
+            ('III. PHÂN TÍCH LOẠI PHÒNG', room_type), ('IV. PHÂN TÍCH NHÓM KHÁCH', group)]
+
+
+def render_page(hotel_id, profile, sections):
+    parts = [f'<h1>Hotel {html.escape(str(hotel_id))}</h1>']
+    for field in PROFILE_FIELDS:
+        parts.append(f'<p><b>{field}:</b> {html.escape(str(profile.get(field, "")))}</p>')
+    for title, items in sections:
+        parts.append(f'<h2>{html.escape(title)}</h2>')
+        for item in items:
+            if item[0] == 'heading':
+                parts.append(f'<h4>{html.escape(item[1])}</h4>')
+            elif item[0] == 'text':
+                parts.append(f'<p>{html.escape(item[1])}</p>')
+            elif item[0] == 'table':
+                parts.append(f'<h4>{html.escape(item[1])}</h4>')
+                parts.append(item[2].to_html(index=False, border=0))
+            elif item[0] == 'bar_chart':
+                # The page draws an interactive bar chart; the report lists the same counts
+                parts.append(f'<h4>{html.escape(item[1])}</h4>')
+                parts.append(item[2].to_frame().to_html(border=0))
+            else:
+                parts.append(f'<h4>{html.escape(item[1])}</h4>')
+                parts.append(f'<img src="{item[2]}.png" alt="{html.escape(item[1])}" style="max-width:100%">')
+    return _page(f'Hotel {hotel_id}', '\n'.join(parts))
+
+
+def _page(title, body):
+    return ('<!DOCTYPE html>\n<html lang="vi">\n<head><meta charset="utf-8">'
+            f'<title>{html.escape(str(title))}</title></head>\n<body>\n{body}\n</body>\n</html>\n')
+
+
+def build_report(hotel_id, out_dir=REPORT_DIR):
+    # Writes one hotel's bundle; runs in a worker process, which loads the store, cube and
+    # token index once from their on-disk caches
+    store = get_store()
+    version = report_version(store, hotel_id)
+    hotel_dir = os.path.join(out_dir, hotel_dir_name(hotel_id))
+    os.makedirs(hotel_dir, exist_ok=True)
+    sections = hotel_sections(hotel_id, store, get_cube(), get_token_index())
+    charts = []
+    for _, items in sections:
+        for item in items:
+            if item[0] == 'chart':
+                write_bytes(os.path.join(hotel_dir, item[2] + '.png'), encode_figure(item[3]()))
+                charts.append(item[2] + '.png')
+    # Charts an earlier version of the report had but this one doesn't
+    for name in os.listdir(hotel_dir):
+        if name.endswith('.png') and name not in charts:
+            os.remove(os.path.join(hotel_dir, name))
+    profile = store.hotel_profile(hotel_id) or {}
+    write_text(os.path.join(hotel_dir, PAGE_FILE), render_page(hotel_id, profile, sections))
+    # The stamp goes last: a hotel interrupted before this point is rebuilt by the next run
+    write_json(os.path.join(hotel_dir, STAMP_FILE), {'hotel_id': hotel_id, 'version': version,
+                                                     'name': str(profile.get('Hotel Name', ''))})
+    return hotel_id
+
+
+def write_index(out_dir, hotel_ids):
+    rows = []
+    for hotel_id in hotel_ids:
+        stamp = _read_stamp(os.path.join(out_dir, hotel_dir_name(hotel_id)))
+        if stamp is not None:
+            link = f'{hotel_dir_name(hotel_id)}/{PAGE_FILE}'
+            rows.append(f'<li><a href="{link}">{html.escape(str(hotel_id))}</a> {html.escape(stamp["name"])}</li>')
+    body = '<h1>Hotel reports</h1>\n<ul>\n' + '\n'.join(rows) + '\n</ul>'
+    write_text(os.path.join(out_dir, PAGE_FILE), _page('Hotel reports', body))
+
+
+def build_reports(out_dir=REPORT_DIR, hotel_ids=None, workers=MAX_WORKERS, force=False):
+    # Returns the hotels built and those whose report failed; failed ones are retried next run
+    # The store, cube and token index are built here first so workers only load them
+    store = get_store()
+    get_cube()
+    get_token_index()
+    hotel_ids = store.hotel_ids() if hotel_ids is None else list(hotel_ids)
+    # As on the insight page, a hotel without reviews has no report
+    missing = [hotel_id for hotel_id in hotel_ids if not store.num_reviews(hotel_id)]
+    for hotel_id in missing:
+        print(f"No review data found for Hotel ID '{hotel_id}', skipped")
+    hotel_ids = [hotel_id for hotel_id in hotel_ids if hotel_id not in missing]
+    pending = [hotel_id for hotel_id in hotel_ids if force or not is_current(out_dir, store, hotel_id)]
+    print(f'{len(hotel_ids) - len(pending)} of {len(hotel_ids)} reports are up to date, building {len(pending)}')
+    os.makedirs(out_dir, exist_ok=True)
+    built, failed = [], []
+    if pending:
+        start = time.perf_counter()
+        # Spawned rather than forked so workers don't share the parent's memory-mapped files
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker) as executor:
+            futures = {executor.submit(build_report, hotel_id, out_dir): hotel_id for hotel_id in pending}
+            for future in as_completed(futures):
+                hotel_id = futures[future]
+                try:
+                    built.append(future.result())
+                except Exception as e:
+                    failed.append(hotel_id)
+                    print(f'{hotel_id}: {type(e).__name__}: {e}')
+                done = len(built) + len(failed)
+                if done % 100 == 0 or done == len(pending):
+                    print(f'{done}/{len(pending)} hotels, {time.perf_counter() - start:.1f}s')
+    write_index(out_dir, hotel_ids)
+    return built, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build static insight reports for every hotel')
+    parser.add_argument('--out', default=REPORT_DIR, help='Output directory')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--hotel', action='append', dest='hotel_ids', help='Only this Hotel ID; repeatable')
+    parser.add_argument('--force', action='store_true', help='Rebuild reports that are up to date')
+    args = parser.parse_args()
+    built, failed = build_reports(args.out, args.hotel_ids, args.workers, args.force)
+    print(f'Built {len(built)} reports in {args.out}, {len(failed)} failed')
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
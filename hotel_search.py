@@ -0,0 +1,211 @@
+import bisect
+import os
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from review_store import HOTEL_ID, PROFILES_PATH
+
+
+# Search over hotel_profiles.csv by Hotel ID, Hotel Name and Hotel Address, insensitive to case
+# and diacritics: "muong thanh" finds "Mường Thanh", "tran phu" finds "Trần Phú"
+
+# Weight of a match in each field; an ID hit outranks a name hit, which outranks an address hit
+FIELD_WEIGHTS = {HOTEL_ID: 3.0, 'Hotel Name': 2.0, 'Hotel Address': 1.0}
+
+# Match quality per query token
+EXACT = 1.0
+PREFIX = 0.8
+FUZZY = 0.6
+
+NGRAM = 3
+# Tokens sharing at least this fraction of trigrams (Dice coefficient) with a query token are fuzzy matches
+MIN_SIMILARITY = 0.4
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9_]+')
+
+
+def fold(text):
+    # Lowercase and strip diacritics; 'đ' has no decomposition and is mapped by hand
+    text = unicodedata.normalize('NFD', str(text).lower()).replace('đ', 'd')
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(fold(text))
+
+
+def ngrams(token, n=NGRAM):
+    padded = f' {token} '
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+class HotelSearchIndex:
+    # Inverted index from folded tokens to hotels. Prefix matches come from a sorted token list
+    # (a flattened trie: all tokens with a given prefix form one contiguous range), fuzzy matches
+    # from a trigram index over the same tokens. Each hotel has a slot, and a query token's
+    # matches are a score array over the slots, so ranking a query is a few array operations.
+    def __init__(self):
+        self.profiles = {}                  # hotel_id -> (name, address) as indexed
+        self._slots = {}                    # hotel_id -> slot
+        self._ids = []                      # slot -> hotel_id, None once removed
+        self._texts = []                    # slot -> folded fields
+        self._name_lengths = []             # slot -> length of the folded name, to break ties
+        self._postings = defaultdict(dict)  # token -> {slot: field weight}
+        self._tokens = []                   # sorted distinct tokens
+        self._ngrams = defaultdict(set)     # trigram -> tokens
+        self._bigrams = defaultdict(set)    # pair of adjacent tokens -> slots, for phrase matches
+        self._cache = {}                    # query token -> score array, cleared whenever the index changes
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, hotel_id, name='', address=''):
+        # Adds a hotel, or re-indexes it if it is already present
+        hotel_id = str(hotel_id)
+        self.remove(hotel_id)
+        self._cache.clear()
+        self._arrays = None
+        slot = len(self._ids)
+        values = {HOTEL_ID: hotel_id, 'Hotel Name': name, 'Hotel Address': address}
+        folded = {field: ' '.join(tokenize(value)) for field, value in values.items() if isinstance(value, str)}
+        self.profiles[hotel_id] = (name, address)
+        self._slots[hotel_id] = slot
+        self._ids.append(hotel_id)
+        # Fields are separated so a phrase never matches across two of them
+        self._texts.append(' | '.join(folded.values()))
+        self._name_lengths.append(len(folded.get('Hotel Name', '')))
+        for field, text in folded.items():
+            for bigram in zip(text.split(), text.split()[1:]):
+                self._bigrams[bigram].add(slot)
+            for token in text.split():
+                postings = self._postings[token]
+                if not postings:
+                    bisect.insort(self._tokens, token)
+                    for gram in ngrams(token):
+                        self._ngrams[gram].add(token)
+                postings[slot] = max(postings.get(slot, 0.0), FIELD_WEIGHTS[field])
+
+    def remove(self, hotel_id):
+        slot = self._slots.pop(hotel_id, None)
+        if slot is None:
+            return
+        self.profiles.pop(hotel_id, None)
+        self._cache.clear()
+        self._arrays = None
+        self._ids[slot] = None
+        for text in self._texts[slot].split(' | '):
+            for bigram in zip(text.split(), text.split()[1:]):
+                self._bigrams[bigram].discard(slot)
+                if not self._bigrams[bigram]:
+                    del self._bigrams[bigram]
+        for token in set(self._texts[slot].split()) - {'|'}:
+            postings = self._postings.get(token)
+            if postings is None or postings.pop(slot, None) is None or postings:
+                continue
+            # Last hotel with this token: drop it from the token list and trigram index
+            del self._postings[token]
+            del self._tokens[bisect.bisect_left(self._tokens, token)]
+            for gram in ngrams(token):
+                self._ngrams[gram].discard(token)
+        self._texts[slot] = ''
+
+    def update(self, profiles):
+        # Index new and edited hotels and drop the ones no longer listed; unchanged rows are skipped
+        rows = {hotel_id: (name, address) for hotel_id, name, address
+                in profiles[[HOTEL_ID, 'Hotel Name', 'Hotel Address']].itertuples(index=False)}
+        for hotel_id in [hotel_id for hotel_id in self.profiles if hotel_id not in rows]:
+            self.remove(hotel_id)
+        for hotel_id, (name, address) in rows.items():
+            if self.profiles.get(hotel_id) != (name, address):
+                self.add(hotel_id, name, address)
+        return self
+
+    def _prefixed(self, prefix):
+        start = bisect.bisect_left(self._tokens, prefix)
+        stop = bisect.bisect_left(self._tokens, prefix + '\uffff')
+        return self._tokens[start:stop]
+
+    def _similar(self, token):
+        grams = ngrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self._ngrams.get(gram, ()):
+                shared[candidate] += 1
+        for candidate, count in shared.items():
+            similarity = 2.0 * count / (len(grams) + len(ngrams(candidate)))
+            if similarity >= MIN_SIMILARITY:
+                yield candidate, similarity
+
+    def _matches(self, token):
+        # Quality of each hotel's best match for this query token. Fuzzy matching is the
+        # fallback for tokens that aren't a prefix of any indexed token, i.e. typos.
+        scores = self._cache.get(token)
+        if scores is not None:
+            return scores
+        scores = np.zeros(len(self._ids))
+
+        def collect(candidate, quality):
+            postings = self._postings[candidate]
+            slots = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            weights = np.fromiter(postings.values(), dtype=np.float64, count=len(postings))
+            np.maximum.at(scores, slots, quality * weights)
+
+        prefixed = self._prefixed(token)
+        for candidate in prefixed:
+            collect(candidate, EXACT if candidate == token else PREFIX * len(token) / len(candidate))
+        if not prefixed and len(token) >= NGRAM:
+            for candidate, similarity in self._similar(token):
+                collect(candidate, FUZZY * similarity)
+        self._cache[token] = scores
+        return scores
+
+    def search(self, query, limit=10):
+        # Hotels matching the most query tokens first, then by score, then shorter names; a query
+        # that appears as a phrase in the name or address gets a bonus so "tran phu" ranks "Trần Phú" first
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        if self._arrays is None:
+            self._arrays = (np.array(self._name_lengths), np.array(self._ids, dtype=object))
+        name_lengths, ids = self._arrays
+        matches = [self._matches(token) for token in tokens]
+        scores = np.sum(matches, axis=0)
+        if len(tokens) > 1:
+            # Every adjacent pair of query tokens appears in the hotel's fields
+            phrase = set.intersection(*(self._bigrams.get(bigram, set()) for bigram in zip(tokens, tokens[1:])))
+            scores[list(phrase)] += 1.0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) == 0:
+            return []
+        scores = scores[candidates]
+        matched = np.sum([token_scores[candidates] > 0 for token_scores in matches], axis=0)
+        # lexsort: last key is the primary one
+        order = np.lexsort((candidates, name_lengths[candidates], -scores, -matched))[:limit]
+        return [(ids[candidates[i]], float(scores[i])) for i in order]
+
+
+_index = None
+_index_stat = None
+_index_lock = threading.Lock()
+
+
+def get_search_index(profiles_path=PROFILES_PATH):
+    # Built once from hotel_profiles.csv; when the file changes only its new or edited rows are indexed
+    global _index, _index_stat
+    with _index_lock:
+        stat = os.stat(profiles_path)
+        if _index is not None and _index_stat == (stat.st_mtime_ns, stat.st_size):
+            return _index
+        profiles = pd.read_csv(profiles_path, dtype={HOTEL_ID: str})
+        profiles = profiles.fillna({'Hotel Name': '', 'Hotel Address': ''})
+        if _index is None:
+            _index = HotelSearchIndex()
+        _index.update(profiles)
+        _index_stat = (stat.st_mtime_ns, stat.st_size)
+        return _index
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from atomic_files import locked, replacing, write_json
+from compact_model import EXPORT_DIR, get_compact_model
+from data_loading import apply_types
+from review_store import HOTEL_ID, append_segment, get_store
+from rollup_cube import RollupCube
+from scoring import SENTIMENT_LABELS, TEXT_COLUMN, clean_texts
+from text_normalization import normalize_batch
+from token_index import TokenIndex
+
+
+# Incremental ingestion of new review batches into the review store:
+#   python ingest.py new_reviews.csv
+# Rows already seen are dropped by content hash, missing Review_new text is normalized from
+# Title/Body, missing sentiment is predicted, and the rollup cube and token index get a delta
+# built from just the new rows.
+INGEST_DIR = os.path.join('.cache', 'ingest')
+HASHES_FILE = 'hashes.u64'
+STATE_FILE = 'state.json'
+DEFAULT_CHUNKSIZE = 50000
+
+# A review's identity: same hotel, reviewer, date and normalized text is the same review
+HASH_COLUMNS = [HOTEL_ID, 'Reviewer Name', 'Review Date', TEXT_COLUMN]
+RAW_TEXT_COLUMNS = ['Title', 'Body']
+
+
+def content_hashes(reviews):
+    # 64-bit hash per row over HASH_COLUMNS; absent columns count as empty
+    keys = pd.DataFrame({column: reviews[column].astype(object).fillna('').astype(str)
+                         if column in reviews.columns else '' for column in HASH_COLUMNS},
+                        index=reviews.index)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy(dtype=np.uint64)
+
+
+def _sorted_contains(sorted_hashes, hashes):
+    if not len(sorted_hashes):
+        return np.zeros(len(hashes), dtype=bool)
+    positions = np.searchsorted(sorted_hashes, hashes)
+    positions[positions == len(sorted_hashes)] = 0
+    return sorted_hashes[positions] == hashes
+
+
+class HashSet:
+    # Persistent set of content hashes: an append-only file of uint64s, held sorted in memory.
+    # Lookups are a binary search and adding a batch appends only that batch to the file. Added
+    # hashes go to a small sorted array that is merged into the main one once it's an eighth of
+    # its size, so a batch doesn't re-sort the whole history.
+    def __init__(self, path):
+        self.path = path
+        hashes = np.fromfile(path, dtype=np.uint64) if os.path.exists(path) else np.empty(0, dtype=np.uint64)
+        # Bytes of the file this instance has seen; another writer changes it (see is_current)
+        self._file_size = hashes.nbytes
+        self._hashes = np.unique(hashes)
+        self._recent = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._hashes) + len(self._recent)
+
+    def is_current(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return size == self._file_size
+
+    def contains(self, hashes):
+        return _sorted_contains(self._hashes, hashes) | _sorted_contains(self._recent, hashes)
+
+    def add(self, hashes):
+        hashes = np.unique(np.asarray(hashes, dtype=np.uint64))
+        hashes = hashes[~self.contains(hashes)]
+        with open(self.path, 'ab') as f:
+            hashes.tofile(f)
+        self._file_size += hashes.nbytes
+        self._recent = np.union1d(self._recent, hashes)
+        if len(self._recent) > len(self._hashes) // 8:
+            self._hashes = np.union1d(self._hashes, self._recent)
+            self._recent = np.empty(0, dtype=np.uint64)
+
+    def reset(self, hashes):
+        hashes = np.unique(np.asarray(hashes, dtype=np.uint64))
+        with replacing(self.path) as tmp_path, open(tmp_path, 'wb') as f:
+            hashes.tofile(f)
+        self._file_size = hashes.nbytes
+        self._hashes = hashes
+        self._recent = np.empty(0, dtype=np.uint64)
+
+
+# Path -> HashSet, kept loaded across the batches (e.g. CSV chunks) ingested by this process
+_hash_sets = {}
+
+
+def seen_hashes(store, ingest_dir=INGEST_DIR):
+    # The set is seeded from the store once, and again whenever the store was rebuilt from
+    # data_final.csv (its 'data' source changed). It is read from disk only on first use or
+    # when another process has written to it since.
+    os.makedirs(ingest_dir, exist_ok=True)
+    path = os.path.join(ingest_dir, HASHES_FILE)
+    hash_set = _hash_sets.get(path)
+    if hash_set is None or not hash_set.is_current():
+        hash_set = _hash_sets[path] = HashSet(path)
+    state_path = os.path.join(ingest_dir, STATE_FILE)
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+    base = [store.sources.get('data'), store.sources.get('version')]
+    if state.get('base') != base:
+        columns = [column for column in HASH_COLUMNS if column in store.table.column_names]
+        hash_set.reset(content_hashes(store.table.select(columns).to_pandas()))
+        write_json(state_path, {'base': base})
+    return hash_set
+
+
+def prepare(batch, export_dir=EXPORT_DIR):
+    # Raw rows -> the columns data_final has: Review_new, Sentiment and the typed columns
+    batch = batch.copy()
+    if TEXT_COLUMN not in batch.columns or batch[TEXT_COLUMN].isna().any():
+        raw = [batch[column].fillna('').astype(str) for column in RAW_TEXT_COLUMNS if column in batch.columns]
+        raw = pd.concat(raw, axis=1).agg(' '.join, axis=1) if raw else pd.Series('', index=batch.index)
+        normalized = pd.Series(normalize_batch(raw, export_dir), index=batch.index)
+        batch[TEXT_COLUMN] = batch[TEXT_COLUMN].fillna(normalized) if TEXT_COLUMN in batch.columns else normalized
+    if 'Sentiment' not in batch.columns:
+        batch['Sentiment'] = np.nan
+    unlabeled = batch['Sentiment'].isna().to_numpy()
+    if unlabeled.any():
+        model = get_compact_model(export_dir)
+        labels = model.predict(clean_texts(batch.loc[unlabeled, TEXT_COLUMN]).tolist())
+        batch['Sentiment'] = batch['Sentiment'].astype(object)
+        batch.loc[unlabeled, 'Sentiment'] = [SENTIMENT_LABELS[int(label)] for label in labels]
+    return apply_types(batch)
+
+
+def to_store_schema(reviews, schema):
+    # Columns in the store's order and types; ones the batch doesn't have are null
+    columns = []
+    for field in schema:
+        if field.name in reviews.columns:
+            values = reviews[field.name]
+            if pa.types.is_dictionary(field.type):
+                values = values.astype(object)
+            column = pa.array(values, from_pandas=True)
+        else:
+            column = pa.nulls(len(reviews))
+        columns.append(column.cast(field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+_ingest_lock = threading.Lock()
+
+
+def ingest(reviews, ingest_dir=INGEST_DIR, export_dir=EXPORT_DIR):
+    # Appends the unseen rows of one batch and returns how many were new. The dedup, the append
+    # and the hash write hold the ingest directory's lock as well as the thread lock, so two
+    # ingest.py runs neither write the same segment nor record each other's rows as seen.
+    reviews = prepare(reviews, export_dir)
+    hashes = content_hashes(reviews)
+    with _ingest_lock, locked(ingest_dir):
+        store = get_store()
+        hash_set = seen_hashes(store, ingest_dir)
+        # Duplicates within the batch, then against everything ingested before
+        new = ~pd.Series(hashes).duplicated().to_numpy() & ~hash_set.contains(hashes)
+        if not new.any():
+            return 0
+        table = to_store_schema(reviews[new].reset_index(drop=True), store.schema)
+        sources = append_segment(table)
+        hash_set.add(hashes[new])
+        # Downstream aggregates get a delta of the new rows saved under the store's new sources,
+        # so their get_*() calls load them instead of rebuilding from the store
+        new_reviews = table.to_pandas()
+        for aggregate in (RollupCube, TokenIndex):
+            aggregate.append(new_reviews, store.sources, sources)
+        return len(new_reviews)
+
+
+def ingest_csv(path, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
+    added = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        added += ingest(chunk, **kwargs)
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append new reviews to the review store, skipping duplicates')
+    parser.add_argument('input', help='CSV with data_final columns; Review_new and Sentiment may be missing')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+    added = ingest_csv(args.input, args.chunksize)
+    print(f'Ingested {added} new reviews from {args.input}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+from wordcloud import WordCloud
+
+
+# Figures of the "Statistics Providing Insight" page. Each function takes the data it plots
+# and returns the figure, so it can be rendered lazily, cached or drawn away from Streamlit.
+
+
+def score_distribution(hotel_id, scores):
+    fig, ax = plt.subplots(figsize=(8, 6))
+    sns.histplot(scores, bins=10, kde=True, color='skyblue', ax=ax)
+    ax.set_title(f'Score Distribution for Hotel {hotel_id}')
+    ax.set_xlabel('Score')
+    ax.set_ylabel('Frequency')
+    return fig
+
+
+def nights_stayed(nights):
+    fig, ax = plt.subplots(figsize=(8, 6))
+    sns.histplot(nights.dropna(), bins=10, kde=True, color='skyblue', ax=ax)
+    ax.set_title('Distribution of Nights Stayed')
+    ax.set_xlabel('Number of Nights')
+    ax.set_ylabel('Frequency')
+    return fig
+
+
+def stays_by_month(stays_by_month):
+    fig, ax = plt.subplots(figsize=(12, 8))
+    sns.barplot(x='Date', y='Count', data=stays_by_month, palette='viridis', ax=ax)
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
+    ax.set_title('Distribution of Stays by Month and Year')
+    ax.set_xlabel('Month and Year')
+    ax.set_ylabel('Count')
+    plt.tight_layout()
+    return fig
+
+
+def sentiment_by_month(monthly_sentiment_counts):
+    fig = plt.figure(figsize=(14, 8))
+    # Create a line plot to show sentiment distribution throughout the year
+    sns.lineplot(data=monthly_sentiment_counts, x='Month', y='Count', hue='Sentiment', marker='o')
+    # Customize plot
+    plt.title('Sentiment Distribution Throughout the Year')
+    plt.xlabel('Month')
+    plt.ylabel('Number of Reviews')
+    plt.xticks(rotation=45)
+    plt.legend(title='Sentiment')
+    plt.tight_layout()
+    return fig
+
+
+def score_boxplot(score_box_stats):
+    fig = plt.figure(figsize=(12, 6))
+    boxes = plt.gca().bxp(score_box_stats, patch_artist=True)
+    for box, color in zip(boxes['boxes'], sns.color_palette('Set2', len(score_box_stats))):
+        box.set_facecolor(color)
+    plt.xticks(rotation=45)
+    plt.title('Score Distribution Through Month-Year by boxplot')
+    plt.xlabel('Month-Year')
+    plt.ylabel('Score')
+    plt.grid(True)
+    return fig
+
+
+def wordcloud(frequencies, title):
+    wordcloud = WordCloud(width=800, height=400, background_color='white', max_words=50).generate_from_frequencies(frequencies)
+    fig = plt.figure(figsize=(10, 6))
+    plt.imshow(wordcloud, interpolation='bilinear')
+    plt.title(title, fontsize=14)
+    plt.axis('off')
+    return fig
+
+
+def nationality_distribution(hotel_id, nationality_counts):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    nationality_counts.plot(kind='bar', color='skyblue', ax=ax)
+    ax.set_title(f'Nationality Distribution for Hotel {hotel_id}')
+    ax.set_xlabel('Nationality')
+    ax.set_ylabel('Count')
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
+    plt.tight_layout()
+    return fig
+
+
+def median_score_by_nationality(median_scores_by_nationality):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    sns.barplot(x='Nationality', y='Score', data=median_scores_by_nationality, palette='viridis', ax=ax)
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
+    ax.set_xlabel('Nationality')
+    ax.set_ylabel('Median Score')
+    ax.set_title('Median Scores by Nationality')
+    plt.tight_layout()
+    return fig
+
+
+def monthly_counts(monthly_counts, hue, title):
+    # Room Type / Group Name distribution throughout the year
+    fig = plt.figure(figsize=(14, 8))
+    sns.barplot(data=monthly_counts, x='Month', y='Count', hue=hue, palette='tab20')
+    # Adjust legend
+    plt.legend(title=hue, bbox_to_anchor=(1.05, 1), loc='upper left', borderaxespad=0.)
+    # Set plot title and labels
+    plt.title(title)
+    plt.xlabel('Month')
+    plt.ylabel('Number of Rooms')
+    plt.xticks(rotation=45)
+    # Adjust layout
+    plt.tight_layout()
+    return fig
+
+
+def sentiment_trends(sentiment_melted, column, title):
+    # One small line chart of sentiment counts per value of column (Room Type / Group Name)
+    values = sentiment_melted[column].unique()
+    # Calculate number of rows needed for the plots
+    n_cols = 3
+    n_rows = max((len(values) + n_cols - 1) // n_cols, 1)  # Ceiling division to handle any remainder
+
+    # Set up the plotting area
+    fig, axes = plt.subplots(nrows=n_rows, ncols=n_cols, figsize=(18, 4 * n_rows))
+
+    # Flatten the axes array for easy iteration
+    axes = axes.flatten()
+
+    # Define the start and end date for the x-axis limits
+    start_date = pd.to_datetime('2022-01-01')
+    end_date = sentiment_melted['Date'].max()
+
+    # Plot data for each value
+    for ax, value in zip(axes, values):
+        value_data = sentiment_melted[sentiment_melted[column] == value]
+        sns.lineplot(data=value_data, x='Date', y='Count', hue='Sentiment', ax=ax, marker='o')
+        ax.set_title(f'{title}: {value}')
+        ax.set_xlabel('Date')
+        ax.set_ylabel('Count of Sentiments')
+        ax.legend(title='Sentiment')
+
+        # Set date format and locator
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%y'))
+        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=2))  # Adjust interval as needed
+
+        # Set x-axis limits
+        ax.set_xlim(start_date, end_date)
+
+        # Rotate and align x-axis labels
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+
+    # Hide any unused subplots
+    for ax in axes[len(values):]:
+        ax.axis('off')
+
+    plt.tight_layout()
+    return fig
@@ -0,0 +1,139 @@
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_loading import to_float
+from review_store import HOTEL_ID, PROFILES_PATH
+
+
+# Hotel ranking over the category scores of hotel_profiles.csv and the sentiment of each
+# hotel's reviews, weighted by the user
+TOTAL_SCORE = 'Total Score'
+CRITERIA = [TOTAL_SCORE, 'Vị trí', 'Độ sạch sẽ', 'Dịch vụ', 'Tiện nghi', 'Đáng giá tiền',
+            'Sự thoải mái và chất lượng phòng']
+# Review shares scaled to 0-10 so they weigh like the category scores
+POSITIVE = 'Đánh giá tích cực'
+NOT_NEGATIVE = 'Đánh giá không tiêu cực'
+SENTIMENT_CRITERIA = [POSITIVE, NOT_NEGATIVE]
+ALL_CRITERIA = CRITERIA + SENTIMENT_CRITERIA
+DEFAULT_WEIGHTS = {criterion: 1.0 for criterion in ALL_CRITERIA}
+# Review shares are pulled towards the overall share as if each hotel had this many more
+# reviews, so a hotel with a single positive review doesn't get a perfect 10
+SENTIMENT_PRIOR = 5
+
+INFO_COLUMNS = ['num', HOTEL_ID, 'Hotel Name', 'Hotel Rank', 'Hotel Address']
+
+STARS_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*sao')
+# Trailing address parts that are postcodes or phone numbers
+NUMBER_PATTERN = re.compile(r'^[\d\s+().-]+$')
+
+
+def parse_stars(ranks):
+    # "4.5 sao trên 5" -> 4.5; "No information" -> NaN
+    stars = ranks.astype(str).str.extract(STARS_PATTERN, expand=False)
+    return to_float(stars).astype(np.float32)
+
+
+def parse_city(address):
+    # The component before the country, e.g. "60 Trần Phú, Lộc Thọ, Nha Trang, Việt Nam, 650000" -> "Nha Trang"
+    parts = [part.strip() for part in str(address).split(',') if part.strip()]
+    while parts and NUMBER_PATTERN.match(parts[-1]):
+        parts.pop()
+    if len(parts) > 1 and parts[-1] == 'Việt Nam':
+        parts.pop()
+    return parts[-1] if parts else ''
+
+
+class Leaderboard:
+    # Scores are parsed once into a float matrix (hotels x criteria, NaN where missing), so a
+    # ranking is one weighted matrix product plus a partial sort of the requested page
+    def __init__(self, profiles, sentiment_counts=None):
+        self.info = profiles[INFO_COLUMNS].reset_index(drop=True)
+        self.stars = parse_stars(profiles['Hotel Rank']).to_numpy()
+        self.cities = pd.Categorical(profiles['Hotel Address'].map(parse_city))
+        matrix = np.full((len(profiles), len(ALL_CRITERIA)), np.nan, dtype=np.float32)
+        for i, criterion in enumerate(CRITERIA):
+            matrix[:, i] = to_float(profiles[criterion])
+        if sentiment_counts is not None:
+            # Hotel ID x sentiment review counts; hotels without reviews stay NaN
+            counts = sentiment_counts.reindex(profiles[HOTEL_ID].astype(str)).to_numpy(dtype=np.float64)
+            totals = np.nansum(counts, axis=1)
+            overall = np.nansum(counts, axis=0) / max(np.nansum(totals), 1.0)
+            shares = (counts + SENTIMENT_PRIOR * overall) / (totals[:, None] + SENTIMENT_PRIOR)
+            shares[~(totals > 0)] = np.nan
+            columns = list(sentiment_counts.columns)
+            matrix[:, ALL_CRITERIA.index(POSITIVE)] = 10.0 * shares[:, columns.index('Tích cực')]
+            matrix[:, ALL_CRITERIA.index(NOT_NEGATIVE)] = 10.0 * (1.0 - shares[:, columns.index('Tiêu cực')])
+        self.matrix = matrix
+        self._present = (~np.isnan(matrix)).astype(np.float32)
+        self._values = np.nan_to_num(matrix)
+
+    def __len__(self):
+        return len(self.info)
+
+    def city_names(self):
+        return [city for city in self.cities.categories if city]
+
+    def scores(self, weights=None):
+        # Weighted mean over the criteria each hotel has; NaN if it has none of the weighted ones
+        weights = DEFAULT_WEIGHTS if weights is None else weights
+        w = np.array([weights.get(criterion, 0.0) for criterion in ALL_CRITERIA], dtype=np.float32)
+        weight_sums = self._present @ w
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = (self._values @ w) / weight_sums
+        scores[weight_sums == 0] = np.nan
+        return scores
+
+    def rank(self, weights=None, min_stars=None, cities=None, page=0, page_size=10):
+        # One page of the ranking, and how many hotels pass the filters
+        scores = self.scores(weights)
+        mask = ~np.isnan(scores)
+        if min_stars:
+            mask &= self.stars >= min_stars
+        if cities:
+            mask &= np.isin(self.cities.codes, [self.cities.categories.get_loc(city) for city in cities])
+        candidates = np.flatnonzero(mask)
+        total = len(candidates)
+        start, stop = page * page_size, min((page + 1) * page_size, total)
+        if start >= stop:
+            return self._frame(candidates[:0], scores, start), total
+        keys = -scores[candidates]
+        if stop < total:
+            # Only the best `stop` hotels are sorted; ties at the cut are all kept so pages
+            # don't depend on the partition order
+            kth = keys[np.argpartition(keys, stop - 1)[stop - 1]]
+            top = np.flatnonzero(keys <= kth)
+        else:
+            top = np.arange(total)
+        # Equal scores keep profile order
+        order = top[np.lexsort((candidates[top], keys[top]))][start:stop]
+        return self._frame(candidates[order], scores, start), total
+
+    def _frame(self, rows, scores, start):
+        frame = self.info.iloc[rows].reset_index(drop=True)
+        frame.insert(0, 'Rank', np.arange(start + 1, start + 1 + len(rows)))
+        frame['Score'] = scores[rows].round(2)
+        criteria = pd.DataFrame(self.matrix[rows].round(1), columns=ALL_CRITERIA)
+        return pd.concat([frame, criteria], axis=1)
+
+
+_leaderboard = None
+_leaderboard_key = None
+_leaderboard_lock = threading.Lock()
+
+
+def get_leaderboard(cube=None, profiles_path=PROFILES_PATH):
+    # Rebuilt only when hotel_profiles.csv or the review data behind the cube change
+    global _leaderboard, _leaderboard_key
+    with _leaderboard_lock:
+        stat = os.stat(profiles_path)
+        key = ((stat.st_mtime_ns, stat.st_size), cube.sources if cube is not None else None)
+        if _leaderboard is not None and _leaderboard_key == key:
+            return _leaderboard
+        profiles = pd.read_csv(profiles_path, dtype={HOTEL_ID: str})
+        _leaderboard = Leaderboard(profiles, cube.sentiment_totals() if cube is not None else None)
+        _leaderboard_key = key
+        return _leaderboard
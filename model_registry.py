@@ -0,0 +1,78 @@
+import hashlib
+import os
+import threading
+
+
+# Artifacts trained and saved in a different environment (see Modeling & Evaluations page)
+MODEL_PATH = 'logistic_regression_model.pkl'
+VECTORIZER_PATH = 'count_vectorizer.pkl'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_digests = {}
+
+
+def cached_file_digest(path):
+    # Re-hash a file only when its mtime or size changed since the last call
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _digests.get(path)
+    if cached is None or cached[0] != key:
+        cached = (key, file_digest(path))
+        _digests[path] = cached
+    return cached[1]
+
+
+class ModelRegistry:
+    # Loads each pickled artifact once per process. Streamlit imports this module once,
+    # so every session and rerun shares the same objects.
+    def __init__(self, mmap_mode='r'):
+        # With mmap_mode the numpy arrays (e.g. coef_) are memory-mapped from the file,
+        # so several server workers on the same box share the pages
+        self.mmap_mode = mmap_mode
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            # Cheap check first: unchanged mtime and size means the artifact is still current
+            if entry is not None and entry['stat'] == (stat.st_mtime_ns, stat.st_size):
+                return entry
+            # The file was touched; only reload when its content actually changed
+            digest = file_digest(path)
+            if entry is not None and entry['digest'] == digest:
+                entry['stat'] = (stat.st_mtime_ns, stat.st_size)
+                return entry
+            # Imported here so the paths and digests above don't cost a joblib import
+            import joblib
+            entry = {
+                'artifact': joblib.load(path, mmap_mode=self.mmap_mode),
+                'digest': digest,
+                'stat': (stat.st_mtime_ns, stat.st_size),
+            }
+            self._entries[path] = entry
+            return entry
+
+    def get(self, path):
+        return self._entry(path)['artifact']
+
+    def digest(self, path):
+        return self._entry(path)['digest']
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide registry shared by all Streamlit sessions
+registry = ModelRegistry()
+
@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import SGDClassifier
+
+from atomic_files import replacing, write_json
+from compact_model import EXPORT_DIR, export, get_compact_model, publish
+from model_registry import MODEL_PATH, VECTORIZER_PATH, registry
+from scoring import LABEL_COLUMN, SENTIMENT_LABELS, TEXT_COLUMN, clean_texts, transform_batch
+
+
+# Online updates of the served model from labeled feedback:
+#   python online_learning.py labeled_reviews.csv
+#   python online_learning.py --rollback
+# An SGD logistic model starts from the coefficients of logistic_regression_model.pkl, over the
+# same count_vectorizer.pkl vocabulary, and is updated with partial_fit one mini-batch at a time.
+# Its state is checkpointed periodically; at each checkpoint it replaces the served compact model
+# only if its accuracy on the holdout set hasn't dropped below the offline model's.
+ONLINE_DIR = os.path.join('.cache', 'online_model')
+CHECKPOINT_FILE = 'checkpoint.npz'
+STATE_FILE = 'state.json'
+HOLDOUT_PATH = 'test_data.csv'
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_CHECKPOINT_EVERY = 20  # mini-batches
+# Largest holdout accuracy loss, relative to the offline model, that may still be served
+DEFAULT_MAX_DROP = 0.005
+
+# Small constant steps keep the model close to its warm start
+SGD_PARAMS = {'loss': 'log_loss', 'alpha': 1e-5, 'learning_rate': 'constant', 'eta0': 1e-3}
+
+
+def encode_labels(labels):
+    # Sentiment names as in data_final, or the label-encoded ids the model predicts
+    labels = pd.Series(labels)
+    if labels.dtype == object or pd.api.types.is_string_dtype(labels):
+        codes = labels.map({name: i for i, name in enumerate(SENTIMENT_LABELS)})
+        codes = codes.fillna(pd.to_numeric(labels, errors='coerce'))
+    else:
+        codes = labels
+    if codes.isna().any():
+        raise ValueError(f'Unknown sentiment labels: {sorted(set(labels[codes.isna()].astype(str)))}')
+    return codes.astype(np.int64).to_numpy()
+
+
+class OnlineModel:
+    def __init__(self, model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH, online_dir=ONLINE_DIR,
+                 holdout_path=HOLDOUT_PATH):
+        self.online_dir = online_dir
+        self.vectorizer = registry.get(vectorizer_path)
+        offline = registry.get(model_path)
+        # Checkpoints belong to one offline model and vocabulary
+        self.base = [registry.digest(model_path), registry.digest(vectorizer_path)]
+        self.classifier = SGDClassifier(**SGD_PARAMS)
+        self.classes = offline.classes_
+        self.batches = 0
+        self.samples = 0
+        if not self._restore():
+            self.classifier.coef_ = np.array(offline.coef_, dtype=np.float64)
+            self.classifier.intercept_ = np.array(offline.intercept_, dtype=np.float64)
+        holdout = pd.read_csv(holdout_path, usecols=[TEXT_COLUMN, LABEL_COLUMN])
+        self._holdout_X = transform_batch(self.vectorizer, holdout[TEXT_COLUMN])
+        self._holdout_y = encode_labels(holdout[LABEL_COLUMN])
+        self.baseline_accuracy = float(np.mean(offline.predict(self._holdout_X) == self._holdout_y))
+
+    def _restore(self):
+        state_path = os.path.join(self.online_dir, STATE_FILE)
+        if not os.path.exists(state_path):
+            return False
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('base') != self.base:
+            return False
+        with np.load(os.path.join(self.online_dir, CHECKPOINT_FILE)) as checkpoint:
+            self.classifier.coef_ = checkpoint['coef']
+            self.classifier.intercept_ = checkpoint['intercept']
+        # Resume the SGD step counter too; the first partial_fit sets up the rest
+        self.classifier.t_ = state['t']
+        self.batches = state['batches']
+        self.samples = state['samples']
+        return True
+
+    def partial_fit(self, texts, labels):
+        X = transform_batch(self.vectorizer, texts)
+        self.classifier.partial_fit(X, encode_labels(labels), classes=self.classes)
+        self.batches += 1
+        self.samples += X.shape[0]
+
+    def checkpoint(self):
+        os.makedirs(self.online_dir, exist_ok=True)
+        path = os.path.join(self.online_dir, CHECKPOINT_FILE)
+        with replacing(path) as tmp_path, open(tmp_path, 'wb') as f:
+            np.savez(f, coef=self.classifier.coef_, intercept=self.classifier.intercept_)
+        state = {'base': self.base, 'batches': self.batches, 'samples': self.samples,
+                 't': float(getattr(self.classifier, 't_', 1.0))}
+        write_json(os.path.join(self.online_dir, STATE_FILE), state)
+
+    def holdout_accuracy(self):
+        scores = self._holdout_X @ self.classifier.coef_.T + self.classifier.intercept_
+        return float(np.mean(self.classes[np.argmax(scores, axis=1)] == self._holdout_y))
+
+    def publish(self, export_dir=EXPORT_DIR, max_drop=DEFAULT_MAX_DROP):
+        # Swaps the served model for this one unless it is worse on the holdout set. Returns the
+        # holdout accuracy and whether the model was published.
+        accuracy = self.holdout_accuracy()
+        if accuracy < self.baseline_accuracy - max_drop:
+            return accuracy, False
+        served = get_compact_model(export_dir)
+        manifest = dict(served.manifest, proba='ovr', online={
+            'batches': self.batches,
+            'samples': self.samples,
+            'holdout_accuracy': accuracy,
+            'baseline_accuracy': self.baseline_accuracy,
+        })
+        publish(manifest, {'coef': self.classifier.coef_.T, 'intercept': self.classifier.intercept_,
+                           'classes': self.classes}, export_dir)
+        return accuracy, True
+
+
+def train(path, batch_size=DEFAULT_BATCH_SIZE, checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+          max_drop=DEFAULT_MAX_DROP, reset=False, export_dir=EXPORT_DIR, online_dir=ONLINE_DIR):
+    if reset and os.path.exists(os.path.join(online_dir, STATE_FILE)):
+        os.remove(os.path.join(online_dir, STATE_FILE))
+    model = OnlineModel(online_dir=online_dir)
+
+    def checkpoint():
+        model.checkpoint()
+        accuracy, published = model.publish(export_dir, max_drop)
+        status = 'published' if published else 'kept the served model'
+        print(f'{model.samples} samples: holdout accuracy {accuracy:.4f} '
+              f'(offline {model.baseline_accuracy:.4f}), {status}')
+
+    pending = 0
+    for chunk in pd.read_csv(path, usecols=[TEXT_COLUMN, LABEL_COLUMN], chunksize=batch_size):
+        chunk = chunk.dropna(subset=[LABEL_COLUMN])
+        if chunk.empty:
+            continue
+        model.partial_fit(clean_texts(chunk[TEXT_COLUMN]), chunk[LABEL_COLUMN])
+        pending += 1
+        if pending == checkpoint_every:
+            checkpoint()
+            pending = 0
+    if pending:
+        checkpoint()
+    return model
+
+
+def rollback(export_dir=EXPORT_DIR, online_dir=ONLINE_DIR):
+    # Serve the offline model again and start the next online run from it
+    export(export_dir=export_dir)
+    if os.path.exists(os.path.join(online_dir, STATE_FILE)):
+        os.remove(os.path.join(online_dir, STATE_FILE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Update the served sentiment model from labeled reviews')
+    parser.add_argument('input', nargs='?', help=f'CSV with {TEXT_COLUMN} and {LABEL_COLUMN} columns')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_EVERY)
+    parser.add_argument('--max-drop', type=float, default=DEFAULT_MAX_DROP)
+    parser.add_argument('--reset', action='store_true', help='Start from the offline model, not the last checkpoint')
+    parser.add_argument('--rollback', action='store_true', help='Serve the offline model again')
+    args = parser.parse_args()
+    if args.rollback:
+        rollback()
+        print(f'Serving {MODEL_PATH} again')
+    elif args.input:
+        train(args.input, args.batch_size, args.checkpoint_every, args.max_drop, args.reset)
+    else:
+        parser.error('an input CSV or --rollback is required')
+
+
+if __name__ == '__main__':
+    main()
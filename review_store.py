@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from aggregates import row_ranges
+from atomic_files import replacing, write_json
+from data_loading import CATEGORICAL_COLUMNS, read_reviews
+from tracing import span
+
+
+DATA_PATH = 'data_final.csv'
+PROFILES_PATH = 'hotel_profiles.csv'
+STORE_DIR = os.path.join('.cache', 'review_store')
+
+HOTEL_ID = 'Hotel ID'
+# The main file and the segments are named after the sources they hold and listed in the index,
+# so a file is never rewritten while an index naming it may still be read
+MAIN_FILE = 'reviews-{}.arrow'
+# Main file of an index written before they were named
+REVIEWS_FILE = 'reviews.arrow'
+INDEX_FILE = 'index.json'
+# Ingested batches are appended as small hotel-sorted segments next to the main file and
+# folded into a new main file once there are more than this many
+SEGMENT_FILE = 'segment-{:06d}-{}.arrow'
+MAX_SEGMENTS = 16
+# Bump when the derived columns change so existing stores are rebuilt
+STORE_VERSION = 3
+
+
+def data_version(sources):
+    # Short fingerprint of a store's sources
+    return hashlib.sha256(json.dumps(sources, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _as_strings(column):
+    # Dictionary-encoded (categorical) columns can't be sorted directly
+    if pa.types.is_dictionary(column.type):
+        return column.cast(column.type.value_type)
+    return column
+
+
+def _wide_dictionaries(table):
+    # Categorical columns get int32 dictionary indices whatever their cardinality, so the main
+    # file and every segment share one schema
+    fields = [pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+              if pa.types.is_dictionary(field.type) else field for field in table.schema]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def _hotel_ranges(hotel_ids):
+    # hotel_ids is sorted, so every hotel occupies one contiguous run of rows
+    codes = hotel_ids.dictionary_encode().combine_chunks()
+    dictionary = codes.dictionary.to_pylist()
+    return {dictionary[code]: [start, stop] for code, (start, stop) in row_ranges(codes.indices.to_numpy()).items()}
+
+
+def _write_sorted(table, path):
+    # Sort by Hotel ID and persist as an uncompressed Arrow IPC file, which can be memory-mapped.
+    # Returns the hotel row ranges of the written file.
+    table = _wide_dictionaries(table.filter(pc.is_valid(table[HOTEL_ID])))
+    hotel_ids = _as_strings(table[HOTEL_ID])
+    order = pc.sort_indices(hotel_ids)
+    table = table.take(order)
+    with replacing(path) as tmp_path, pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return _hotel_ranges(hotel_ids.take(order))
+
+
+def _read_index(store_dir):
+    with open(os.path.join(store_dir, INDEX_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_index(store_dir, index):
+    write_json(os.path.join(store_dir, INDEX_FILE), index, ensure_ascii=False)
+
+
+def _remove_unlisted(store_dir, index):
+    # Files the index no longer lists, once it has been replaced. Processes that have them
+    # mapped keep their copy; one that read the old index but hasn't opened them yet retries
+    # (see get_store). Temp files (*.tmp) are left to the writers that own them.
+    listed = {index['main']} | {segment['file'] for segment in index['segments']}
+    for name in os.listdir(store_dir):
+        if name.endswith('.arrow') and name not in listed:
+            try:
+                os.remove(os.path.join(store_dir, name))
+            except OSError:
+                pass
+
+
+def write_store(table, store_dir, sources):
+    # A rebuilt store starts without ingested segments
+    os.makedirs(store_dir, exist_ok=True)
+    main = MAIN_FILE.format(data_version(sources))
+    ranges = _write_sorted(table, os.path.join(store_dir, main))
+    index = {'sources': sources, 'main': main, 'ranges': ranges, 'segments': []}
+    _write_index(store_dir, index)
+    _remove_unlisted(store_dir, index)
+
+
+def append_segment(table, store_dir=STORE_DIR):
+    # Adds a batch of new reviews without rewriting the main file: cost is proportional to the
+    # batch. The sources change, so every cache keyed on them sees the new data.
+    index = _read_index(store_dir)
+    segments = index.get('segments', [])
+    batch = index['sources'].get('ingested', 0) + 1
+    index['sources'] = dict(index['sources'], ingested=batch)
+    name = SEGMENT_FILE.format(batch, data_version(index['sources']))
+    ranges = _write_sorted(table, os.path.join(store_dir, name))
+    index['segments'] = segments + [{'file': name, 'ranges': ranges}]
+    _write_index(store_dir, index)
+    if len(index['segments']) > MAX_SEGMENTS:
+        compact_store(store_dir)
+    return index['sources']
+
+
+def compact_store(store_dir=STORE_DIR):
+    # Folds the segments into a new main file. The content doesn't change, so neither do the
+    # sources; the main file being replaced was written for earlier ones, so the names differ.
+    store = ReviewStore(store_dir, profiles_path=None)
+    # An IPC file holds one dictionary per column, so the per-segment dictionaries are merged first
+    table = store.table.unify_dictionaries().combine_chunks()
+    main = MAIN_FILE.format(data_version(store.sources))
+    ranges = _write_sorted(table, os.path.join(store_dir, main))
+    index = {'sources': store.sources, 'main': main, 'ranges': ranges, 'segments': []}
+    _write_index(store_dir, index)
+    _remove_unlisted(store_dir, index)
+
+
+def build_store(data_path=DATA_PATH, store_dir=STORE_DIR):
+    # Typed read: categorical columns become dictionary-encoded Arrow columns
+    with span('load.build_store') as s:
+        table = pa.Table.from_pandas(read_reviews(data_path), preserve_index=False)
+        write_store(table, store_dir, {'data': _source_stat(data_path), 'version': STORE_VERSION})
+        s.set_rows(len(table))
+
+
+class ReviewStore:
+    # Hotel-partitioned review table: a Hotel ID -> (start, stop) row range over a
+    # memory-mapped Arrow file. A lookup touches only that hotel's pages.
+    def __init__(self, store_dir=STORE_DIR, profiles_path=PROFILES_PATH):
+        index_path = os.path.join(store_dir, INDEX_FILE)
+        index_stat = os.stat(index_path)
+        self.index_stat = (index_stat.st_mtime_ns, index_stat.st_size)
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+        self.sources = index['sources']
+        self.ranges = index['ranges']
+        # Short fingerprint of the sources, used to key caches derived from this store
+        self.data_version = data_version(self.sources)
+        self._source = pa.memory_map(os.path.join(store_dir, index.get('main', REVIEWS_FILE)), 'r')
+        main = pa.ipc.open_file(self._source).read_all()
+        # Ingested segments, each with its own hotel ranges over its own file
+        self.segments = []
+        for segment in index.get('segments', []):
+            source = pa.memory_map(os.path.join(store_dir, segment['file']), 'r')
+            self.segments.append((pa.ipc.open_file(source).read_all().cast(main.schema), segment['ranges']))
+        self.table = pa.concat_tables([main] + [table for table, _ in self.segments]) if self.segments else main
+        self._main = main
+        self.schema = main.schema
+        self.profiles = self._load_profiles(profiles_path) if profiles_path else {}
+
+    @staticmethod
+    def _load_profiles(profiles_path):
+        hotel_info = pd.read_csv(profiles_path, dtype={HOTEL_ID: str})
+        return {row[HOTEL_ID]: row for row in hotel_info.to_dict('records')}
+
+    def _slices(self, hotel_id):
+        # Zero-copy slices of the memory-mapped main file and of every segment holding the hotel
+        start, stop = self.ranges.get(hotel_id, (0, 0))
+        yield self._main.slice(start, stop - start)
+        for table, ranges in self.segments:
+            if hotel_id in ranges:
+                start, stop = ranges[hotel_id]
+                yield table.slice(start, stop - start)
+
+    def hotel_ids(self):
+        hotel_ids = dict.fromkeys(self.ranges)
+        for _, ranges in self.segments:
+            hotel_ids.update(dict.fromkeys(ranges))
+        return list(hotel_ids)
+
+    def num_reviews(self, hotel_id):
+        return sum(len(table) for table in self._slices(hotel_id))
+
+    def hotel_table(self, hotel_id):
+        return pa.concat_tables(list(self._slices(hotel_id)))
+
+    def hotel_version(self, hotel_id):
+        # Changes only when reviews of this hotel are added, so cached charts of other hotels
+        # survive an ingest
+        key = json.dumps([self.sources.get('data'), self.sources.get('version'), self.num_reviews(hotel_id)])
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def hotel_reviews(self, hotel_id):
+        with span('filter.hotel_reviews', hotel=hotel_id) as s:
+            df = self.hotel_table(hotel_id).to_pandas()
+            # Keep only the categories present for this hotel so counts and plots match its rows
+            for column in CATEGORICAL_COLUMNS:
+                if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype):
+                    df[column] = df[column].cat.remove_unused_categories()
+            s.set_rows(len(df))
+        return df
+
+    def hotel_profile(self, hotel_id):
+        return self.profiles.get(hotel_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _is_stale(store_dir, data_path):
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return True
+    if not os.path.exists(data_path):
+        # Keep serving the existing store when the source CSV isn't shipped
+        return False
+    with open(index_path, encoding='utf-8') as f:
+        sources = json.load(f)['sources']
+    return sources.get('data') != _source_stat(data_path) or sources.get('version') != STORE_VERSION
+
+
+def get_store(data_path=DATA_PATH, profiles_path=PROFILES_PATH, store_dir=STORE_DIR):
+    # Build the store once from the CSVs and share it across Streamlit sessions. Reloaded when
+    # its index changes, e.g. after an ingest.
+    global _store
+    with _store_lock:
+        if _store is None:
+            if _is_stale(store_dir, data_path):
+                build_store(data_path, store_dir)
+            _store = _open_store(store_dir, profiles_path)
+        else:
+            index_stat = os.stat(os.path.join(store_dir, INDEX_FILE))
+            if _store.index_stat != (index_stat.st_mtime_ns, index_stat.st_size):
+                _store = _open_store(store_dir, profiles_path)
+        return _store
+
+
+def _open_store(store_dir, profiles_path):
+    try:
+        return ReviewStore(store_dir, profiles_path)
+    except FileNotFoundError:
+        # Compacted between reading the index and opening the files it listed
+        return ReviewStore(store_dir, profiles_path)
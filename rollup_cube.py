@@ -0,0 +1,126 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import PersistedAggregate, get_aggregate, row_ranges
+from review_store import HOTEL_ID, get_store
+from tracing import span
+
+
+CUBE_DIR = os.path.join('.cache', 'rollup_cube')
+COUNTS_FILE = 'counts.parquet'
+SCORES_FILE = 'scores.parquet'
+
+# Dimensions broken down by month and sentiment; 'All' is the hotel-wide total
+ALL = 'All'
+DIMENSIONS = ['Room Type', 'Group Name']
+SENTIMENTS = ['Tích cực', 'Tiêu cực', 'Trung tính']
+
+COUNT_KEYS = [HOTEL_ID, 'Month', 'Dimension', 'Value', 'Sentiment']
+SCORE_KEYS = [HOTEL_ID, 'Month', 'Score']
+SOURCE_COLUMNS = [HOTEL_ID, 'Date', 'Sentiment', 'Score'] + DIMENSIONS
+
+
+def _month(dates):
+    return pd.to_datetime(dates).dt.to_period('M').dt.to_timestamp()
+
+
+def rollup_counts(reviews):
+    # Review counts keyed by (hotel, month, dimension, value, sentiment). Reviews without a
+    # parseable date are counted under a NaT month: the monthly views leave them out, but the
+    # hotel totals (sentiment_totals) include them.
+    reviews = reviews.assign(Month=_month(reviews['Date']))
+    frames = []
+    for dimension in [ALL] + DIMENSIONS:
+        value = '' if dimension == ALL else reviews[dimension].astype(object)
+        frame = reviews[[HOTEL_ID, 'Month', 'Sentiment']].astype({HOTEL_ID: object, 'Sentiment': object})
+        frame = frame.assign(Dimension=dimension, Value=value).dropna(subset=[HOTEL_ID, 'Value', 'Sentiment'])
+        frames.append(frame.groupby(COUNT_KEYS, dropna=False).size().reset_index(name='Count'))
+    return pd.concat(frames, ignore_index=True)
+
+
+def rollup_scores(reviews):
+    # Counts per distinct Score value; additive, so box-plot statistics can be rebuilt exactly
+    reviews = reviews.assign(Month=_month(reviews['Date']))
+    scores = reviews[[HOTEL_ID, 'Month', 'Score']].astype({HOTEL_ID: object})
+    return scores.groupby(SCORE_KEYS).size().reset_index(name='Count')
+
+
+class RollupCube(PersistedAggregate):
+    # Precomputed per-hotel monthly aggregates for sections I-IV of the insight page.
+    # Every measure is a count, so new reviews are folded in by addition.
+    # 2: undated reviews are counted under a NaT month
+    VERSION = 2
+    DIRECTORY = CUBE_DIR
+    TABLES = {'counts': COUNTS_FILE, 'scores': SCORES_FILE}
+    KEYS = {'counts': COUNT_KEYS, 'scores': SCORE_KEYS}
+    SOURCE_COLUMNS = SOURCE_COLUMNS
+
+    def __init__(self, counts, scores, sources=None):
+        super().__init__(sources)
+        self.counts = counts.sort_values(COUNT_KEYS, kind='stable', ignore_index=True)
+        self.scores = scores.sort_values(SCORE_KEYS, kind='stable', ignore_index=True)
+        self._index()
+
+    def _index(self):
+        # Hotel ID -> row range, as in the review store
+        self._count_ranges = row_ranges(self.counts[HOTEL_ID].to_numpy())
+        self._score_ranges = row_ranges(self.scores[HOTEL_ID].to_numpy())
+
+    @classmethod
+    def build(cls, reviews):
+        with span('aggregate.build_rollup_cube', rows=len(reviews)):
+            return cls(rollup_counts(reviews), rollup_scores(reviews))
+
+    def _hotel_counts(self, hotel_id, dimension):
+        # Dated rows only: every caller breaks the counts down by month
+        start, stop = self._count_ranges.get(hotel_id, (0, 0))
+        counts = self.counts.iloc[start:stop]
+        return counts[(counts['Dimension'] == dimension) & counts['Month'].notna()]
+
+    def monthly_sentiment_counts(self, hotel_id):
+        counts = self._hotel_counts(hotel_id, ALL)
+        return counts[['Month', 'Sentiment', 'Count']].reset_index(drop=True)
+
+    def stays_by_month(self, hotel_id):
+        counts = self._hotel_counts(hotel_id, ALL)
+        return counts.groupby('Month')['Count'].sum().reset_index().rename(columns={'Month': 'Date'})
+
+    def dimension_counts(self, hotel_id, dimension):
+        counts = self._hotel_counts(hotel_id, dimension)
+        counts = counts.groupby(['Month', 'Value'], sort=False)['Count'].sum().reset_index()
+        return counts.rename(columns={'Value': dimension})
+
+    def sentiment_trends(self, hotel_id, dimension):
+        # Date x dimension x sentiment counts with zeros filled in for every sentiment
+        counts = self._hotel_counts(hotel_id, dimension).rename(columns={'Month': 'Date', 'Value': dimension})
+        pivot = counts.pivot_table(index=['Date', dimension], columns='Sentiment', values='Count',
+                                   aggfunc='sum', fill_value=0)
+        pivot = pivot.reindex(columns=SENTIMENTS, fill_value=0).reset_index()
+        return pivot.melt(id_vars=['Date', dimension], value_vars=SENTIMENTS,
+                          var_name='Sentiment', value_name='Count')
+
+    def sentiment_totals(self):
+        # Hotel ID x sentiment review counts over all months and undated reviews, for every hotel at once
+        counts = self.counts[self.counts['Dimension'] == ALL]
+        totals = counts.pivot_table(index=HOTEL_ID, columns='Sentiment', values='Count', aggfunc='sum', fill_value=0)
+        return totals.reindex(columns=SENTIMENTS, fill_value=0)
+
+    def score_box_stats(self, hotel_id):
+        # Box-plot statistics per month, computed from the per-score counts. matplotlib is only
+        # imported by the page that draws them.
+        from matplotlib import cbook
+        start, stop = self._score_ranges.get(hotel_id, (0, 0))
+        stats = []
+        for month, group in self.scores.iloc[start:stop].groupby('Month'):
+            values = np.repeat(group['Score'].to_numpy(), group['Count'].to_numpy())
+            month_stats = cbook.boxplot_stats(values)[0]
+            month_stats['label'] = str(pd.Period(month, freq='M'))
+            stats.append(month_stats)
+        return stats
+
+
+def get_cube(cube_dir=CUBE_DIR):
+    # Built once from the review store and rebuilt only when the store's sources change
+    return get_aggregate(RollupCube, cube_dir, get_store())
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from model_registry import MODEL_PATH, VECTORIZER_PATH  # noqa: F401
+
+
+TEXT_COLUMN = 'Review_new'
+LABEL_COLUMN = 'Sentiment'
+
+# Class ids of the model map to the label-encoded sentiments of data_final
+SENTIMENT_LABELS = ['Tiêu cực', 'Trung tính', 'Tích cực']
+
+# Rows transformed per step; memory use is bounded by this, not by the dataset size
+DEFAULT_BATCH_SIZE = 2048
+
+
+def clean_texts(texts):
+    # Handle NaN values by filling them with an empty string
+    return pd.Series(texts, dtype=object).fillna('').astype(str)
+
+
+def iter_batches(texts, batch_size=DEFAULT_BATCH_SIZE):
+    texts = clean_texts(texts)
+    for start in range(0, len(texts), batch_size):
+        yield texts.iloc[start:start + batch_size]
+
+
+def transform_batch(vectorizer, texts):
+    # CountVectorizer returns a sparse CSR matrix; it is passed to the model as is
+    return vectorizer.transform(clean_texts(texts))
+
+
+def predict_batches(model, vectorizer, texts, batch_size=DEFAULT_BATCH_SIZE):
+    for batch in iter_batches(texts, batch_size):
+        yield model.predict(transform_batch(vectorizer, batch))
+
+
+def predict(model, vectorizer, texts, batch_size=DEFAULT_BATCH_SIZE):
+    preds = list(predict_batches(model, vectorizer, texts, batch_size))
+    if not preds:
+        return np.empty(0, dtype=model.classes_.dtype)
+    return np.concatenate(preds)
+
+
+def predict_proba(model, vectorizer, texts, batch_size=DEFAULT_BATCH_SIZE):
+    probas = [model.predict_proba(transform_batch(vectorizer, batch))
+              for batch in iter_batches(texts, batch_size)]
+    if not probas:
+        return np.empty((0, len(model.classes_)))
+    return np.vstack(probas)
+
+
+def score_csv(path, model, vectorizer, batch_size=DEFAULT_BATCH_SIZE,
+              text_column=TEXT_COLUMN, label_column=LABEL_COLUMN):
+    # Read the CSV in chunks so only one batch of text and features is resident at a time.
+    # Returns the labels, the predictions and the text of the misclassified rows in row order.
+    y_true, preds, misclassified_texts = [], [], []
+    for chunk in pd.read_csv(path, usecols=[text_column, label_column], chunksize=batch_size):
+        texts = clean_texts(chunk[text_column])
+        labels = chunk[label_column].to_numpy()
+        chunk_preds = model.predict(transform_batch(vectorizer, texts))
+        y_true.append(labels)
+        preds.append(chunk_preds)
+        misclassified_texts += texts[labels != chunk_preds].tolist()
+    if not preds:
+        return np.empty(0), np.empty(0), []
+    return np.concatenate(y_true), np.concatenate(preds), misclassified_texts
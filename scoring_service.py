@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import urllib.request
+from collections import deque
+
+import numpy as np
+
+from compact_model import EXPORT_DIR, get_compact_model, warm_up
+from scoring import SENTIMENT_LABELS
+
+
+# Local HTTP scoring service around the pre-trained vectorizer and logistic regression model,
+# served through the NumPy-only compact export (see compact_model.py).
+#   python scoring_service.py --port 8502 --max-batch-size 64 --max-wait-ms 5
+# POST /predict {"texts": [...]} -> labels, sentiments and class probabilities
+# GET /metrics -> batch and latency statistics
+# The Procfile starts it in the background of the web process, next to the Streamlit app; the
+# app classifies in-process whenever the service isn't reachable.
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8502
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 5.0
+
+SERVICE_URL = os.environ.get('SCORING_SERVICE_URL', f'http://{DEFAULT_HOST}:{DEFAULT_PORT}')
+REQUEST_TIMEOUT = 10
+
+# Latencies kept for the p50/p99 figures
+LATENCY_WINDOW = 10000
+
+
+def _result(labels, probabilities):
+    labels = [int(label) for label in labels]
+    return {
+        'labels': labels,
+        'sentiments': [SENTIMENT_LABELS[label] for label in labels],
+        'probabilities': [list(map(float, proba)) for proba in probabilities],
+    }
+
+
+def request_predictions(texts, url=SERVICE_URL, timeout=REQUEST_TIMEOUT):
+    # Client side, used by the Customer Feedback Classification page
+    data = json.dumps({'texts': list(texts)}, ensure_ascii=False).encode('utf-8')
+    request = urllib.request.Request(url + '/predict', data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def predict_locally(texts, export_dir=EXPORT_DIR):
+    # Same response as the service, scored in this process
+    model = get_compact_model(export_dir)
+    probas = model.predict_proba(list(texts))
+    return _result(model.classes_[np.argmax(probas, axis=1)], probas)
+
+
+class MicroBatcher:
+    # Groups texts from concurrent requests so one sparse transform + predict serves them all.
+    # A batch is closed when it reaches max_batch_size or max_wait after its first text.
+    def __init__(self, export_dir=EXPORT_DIR, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.export_dir = export_dir
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batches = 0
+        self.texts = 0
+        self._queue = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        warm_up(self.export_dir)
+        return asyncio.ensure_future(self._run())
+
+    async def predict(self, text):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score(self, texts):
+        model = get_compact_model(self.export_dir)
+        return model.predict_proba(texts), model.classes_
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                # Scoring runs off the event loop so new requests keep queueing meanwhile
+                probas, classes = await loop.run_in_executor(None, self._score, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(batch)
+            for (_, future), proba in zip(batch, probas):
+                if not future.done():
+                    label = int(classes[int(np.argmax(proba))])
+                    future.set_result((label, proba.tolist()))
+
+    def metrics(self):
+        latencies = np.array(self.latencies) * 1000.0
+        return {
+            'requests': len(latencies),
+            'batches': self.batches,
+            'texts': self.texts,
+            'mean_batch_size': self.texts / self.batches if self.batches else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+        }
+
+
+def _texts(payload):
+    # {"texts": [str, ...]} or {"text": str}; anything else is a client error (ValueError -> 400)
+    if not isinstance(payload, dict):
+        raise ValueError('Request body must be a JSON object')
+    texts = payload['texts'] if 'texts' in payload else [payload.get('text', '')]
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise ValueError('"texts" must be a list of strings' if 'texts' in payload else '"text" must be a string')
+    return texts
+
+
+async def _read_request(reader):
+    # None at end of stream; ValueError for a request that can't be parsed
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    if not request_line:
+        return None
+    parts = request_line.split(' ')
+    if len(parts) != 3:
+        raise ValueError(f'Malformed request line: {request_line[:100]!r}')
+    method, path, _ = parts
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length < 0:
+        raise ValueError('Negative Content-Length')
+    body = await reader.readexactly(length)
+    return method, path, headers, body
+
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (f'HTTP/1.1 {status}\r\n'
+            'Content-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    return head.encode('latin-1') + body
+
+
+class ScoringService:
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    async def predict(self, payload):
+        started = time.perf_counter()
+        texts = _texts(payload)
+        results = await asyncio.gather(*(self.batcher.predict(text) for text in texts))
+        self.batcher.latencies.append(time.perf_counter() - started)
+        return _result([label for label, _ in results], [proba for _, proba in results])
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError as e:
+                    # The rest of the stream can't be framed, so the connection is closed after the 400
+                    writer.write(_response('400 Bad Request', {'error': str(e)}, False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if method == 'POST' and path == '/predict':
+                    try:
+                        response = _response('200 OK', await self.predict(json.loads(body or b'{}')), keep_alive)
+                    except (ValueError, TypeError) as e:
+                        response = _response('400 Bad Request', {'error': str(e)}, keep_alive)
+                    except Exception as e:
+                        # Anything else is the service's fault; the connection stays usable
+                        response = _response('500 Internal Server Error',
+                                             {'error': f'{type(e).__name__}: {e}'}, keep_alive)
+                elif method == 'GET' and path == '/metrics':
+                    response = _response('200 OK', self.batcher.metrics(), keep_alive)
+                elif method == 'GET' and path == '/health':
+                    response = _response('200 OK', {'status': 'ok'}, keep_alive)
+                else:
+                    response = _response('404 Not Found', {'error': f'No route for {method} {path}'}, keep_alive)
+                writer.write(response)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                max_wait_ms=DEFAULT_MAX_WAIT_MS):
+    batcher = MicroBatcher(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    batcher.start()
+    server = await asyncio.start_server(ScoringService(batcher).handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-batching sentiment scoring service')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.max_batch_size, args.max_wait_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from dateutil import parser
+
+from tracing import span
+
+
+# "Đã ở 2 đêm vào Tháng 3 năm 2023"
+NIGHTS_PATTERN = re.compile(r'(?<!\S)(\d+)\s+đêm(?!\S)')
+MONTH_YEAR_PATTERN = re.compile(r'tháng\s+(\d{1,2})\s+năm\s+(\d{4})', re.IGNORECASE)
+
+# Parsed (nights, date) per distinct Stay Details string, shared by every page render
+_cache = {}
+
+
+def extract_month_year(stay_details):
+    # Fallback for strings outside the "Tháng X năm YYYY" format
+    try:
+        date = parser.parse(stay_details, fuzzy=True)
+        return date.strftime('%B %Y')
+    except:
+        return None
+
+
+def convert_to_datetime(month_year_str):
+    try:
+        return datetime.strptime(month_year_str, '%B %Y')
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_unique(stay_details):
+    stay_details = pd.Series(stay_details, dtype=object).astype(str)
+    nights = pd.to_numeric(stay_details.str.extract(NIGHTS_PATTERN)[0], errors='coerce')
+    month_year = stay_details.str.extract(MONTH_YEAR_PATTERN).apply(pd.to_numeric, errors='coerce')
+    dates = pd.to_datetime(pd.DataFrame({'year': month_year[1], 'month': month_year[0], 'day': 1}),
+                           errors='coerce')
+    # Only strings the regex didn't recognise go through the slow fuzzy parser
+    unrecognized = dates.isna()
+    if unrecognized.any():
+        fallback = stay_details[unrecognized].map(extract_month_year).map(convert_to_datetime)
+        dates[unrecognized] = pd.to_datetime(fallback)
+    return nights.to_numpy(dtype='float32'), dates.to_numpy(dtype='datetime64[ns]')
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def parse_stay_details(stay_details):
+    # Returns ('Nights Stayed', 'Date') for a Series of Stay Details strings. Each distinct
+    # string is parsed once per process; rows are filled by broadcasting through category codes.
+    stay_details = stay_details.astype('category')
+    categories = list(stay_details.cat.categories)
+    missing = [category for category in categories if category not in _cache]
+    if missing:
+        with span('parse.stay_details', rows=len(missing)):
+            nights, dates = _parse_unique(missing)
+        _cache.update(zip(missing, zip(nights, dates)))
+    nights = np.array([_cache[category][0] for category in categories], dtype='float32')
+    dates = np.array([_cache[category][1] for category in categories], dtype='datetime64[ns]')
+    codes = stay_details.cat.codes.to_numpy()
+    valid = codes >= 0
+    nights_stayed = np.full(len(codes), np.nan, dtype='float32')
+    date = np.full(len(codes), np.datetime64('NaT'), dtype='datetime64[ns]')
+    nights_stayed[valid] = nights[codes[valid]]
+    date[valid] = dates[codes[valid]]
+    return (pd.Series(nights_stayed, index=stay_details.index),
+            pd.Series(date, index=stay_details.index))
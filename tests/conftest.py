@@ -0,0 +1,36 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aggregates  # noqa: E402
+import ingest  # noqa: E402
+import review_store  # noqa: E402
+from benchmarks import ReviewGenerator  # noqa: E402
+
+
+BASE_REVIEWS = 2000
+
+
+@pytest.fixture
+def generator():
+    # Synthetic data_final rows over the shipped hotels and test-set vocabulary
+    return ReviewGenerator(os.path.join(ROOT, 'test_data.csv'), os.path.join(ROOT, 'hotel_profiles.csv'), seed=0)
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch, generator):
+    # A fresh working directory with data_final.csv and hotel_profiles.csv: the store, the
+    # aggregates and the ingest state are all kept under its .cache
+    generator.reviews(BASE_REVIEWS).to_csv(tmp_path / 'data_final.csv', index=False)
+    shutil.copy(os.path.join(ROOT, 'hotel_profiles.csv'), tmp_path / 'hotel_profiles.csv')
+    monkeypatch.chdir(tmp_path)
+    # Process-wide instances of earlier tests belong to other directories
+    monkeypatch.setattr(review_store, '_store', None)
+    monkeypatch.setattr(aggregates, '_aggregates', {})
+    monkeypatch.setattr(ingest, '_hash_sets', {})
+    return tmp_path
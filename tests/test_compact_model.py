@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from compact_model import CompactModel, export
+from conftest import ROOT
+from scoring import TEXT_COLUMN, clean_texts
+
+
+joblib = pytest.importorskip('joblib')
+pytest.importorskip('sklearn')
+
+MODEL_PATH = os.path.join(ROOT, 'logistic_regression_model.pkl')
+VECTORIZER_PATH = os.path.join(ROOT, 'count_vectorizer.pkl')
+
+
+@pytest.fixture(scope='module')
+def models(tmp_path_factory):
+    # The compact export next to the pickles it was exported from
+    export_dir = str(tmp_path_factory.mktemp('compact_model'))
+    export(MODEL_PATH, VECTORIZER_PATH, export_dir)
+    return CompactModel(export_dir), joblib.load(MODEL_PATH), joblib.load(VECTORIZER_PATH)
+
+
+def test_predictions_match_sklearn(models):
+    # What `python compact_model.py --check test_data.csv` checks
+    compact, model, vectorizer = models
+    texts = clean_texts(pd.read_csv(os.path.join(ROOT, 'test_data.csv'), usecols=[TEXT_COLUMN])[TEXT_COLUMN])
+    X = vectorizer.transform(texts)
+    np.testing.assert_array_equal(compact.predict(texts), model.predict(X))
+    np.testing.assert_array_equal(compact.decision_function(texts[:500]), model.decision_function(X[:500]))
+
+
+def test_tokens_wider_than_the_vocabulary_are_unknown(models):
+    compact, model, vectorizer = models
+    longest = max(vectorizer.vocabulary_, key=len)
+    # Cast to the vocabulary's fixed width, the first one used to match `longest`
+    texts = [longest + 'xyz', longest, f'{longest}xyz {longest}', 'nhiệt_tình_quản_trị_viênxyz']
+    rows, columns, counts = compact.counts(texts)
+    X = vectorizer.transform(texts).tocoo()
+    order = np.lexsort((X.col, X.row))
+    np.testing.assert_array_equal(rows, X.row[order])
+    np.testing.assert_array_equal(columns, X.col[order])
+    np.testing.assert_array_equal(counts, X.data[order])
+    np.testing.assert_array_equal(compact.decision_function(texts), model.decision_function(vectorizer.transform(texts)))
@@ -0,0 +1,206 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import aggregates
+import ingest
+import review_store
+from conftest import BASE_REVIEWS
+from review_store import HOTEL_ID, get_store
+from rollup_cube import CUBE_DIR, RollupCube, get_cube
+from token_index import INDEX_DIR, TokenIndex, get_token_index
+
+
+def rebuilt(cls):
+    # The aggregate built from scratch over the store's current rows
+    return cls.build(get_store().table.select(cls.SOURCE_COLUMNS).to_pandas())
+
+
+def reload_aggregates(monkeypatch):
+    # Drop the in-memory instances so the next get_*() reads the saved base and deltas
+    monkeypatch.setattr(aggregates, '_aggregates', {})
+    return get_cube(), get_token_index()
+
+
+def assert_same_aggregates(cube, token_index):
+    full_cube, full_index = rebuilt(RollupCube), rebuilt(TokenIndex)
+    pd.testing.assert_frame_equal(cube.counts, full_cube.counts)
+    pd.testing.assert_frame_equal(cube.scores, full_cube.scores)
+    pd.testing.assert_frame_equal(token_index.counts, full_index.counts)
+
+
+def batch(generator, n, start):
+    # New reviews: reviewer names start after the base rows, so none of them are duplicates
+    return generator.reviews(n, start=BASE_REVIEWS + start)
+
+
+def test_incremental_aggregates_match_rebuild(workspace, generator, monkeypatch):
+    get_cube()
+    get_token_index()
+    added = 0
+    for i in range(3):
+        added += ingest.ingest(batch(generator, 150, 150 * i))
+    assert added == 450
+    assert len(get_store().table) == BASE_REVIEWS + 450
+    cube, token_index = reload_aggregates(monkeypatch)
+    assert cube.sources == get_store().sources
+    assert_same_aggregates(cube, token_index)
+    # Same answers the pages read, including the top-word order of ties
+    full_cube, full_index = rebuilt(RollupCube), rebuilt(TokenIndex)
+    for hotel_id in get_store().hotel_ids()[:5]:
+        pd.testing.assert_frame_equal(cube.monthly_sentiment_counts(hotel_id), full_cube.monthly_sentiment_counts(hotel_id))
+        np.testing.assert_equal(cube.score_box_stats(hotel_id), full_cube.score_box_stats(hotel_id))
+        pd.testing.assert_frame_equal(token_index.top_k(hotel_id, 'Tích cực'), full_index.top_k(hotel_id, 'Tích cực'))
+
+
+def test_ingest_csv_chunks(workspace, generator, monkeypatch):
+    get_cube()
+    get_token_index()
+    batch(generator, 500, 0).to_csv('new_reviews.csv', index=False)
+    assert ingest.ingest_csv('new_reviews.csv', chunksize=100) == 500
+    # One hash set served every chunk
+    assert len(ingest._hash_sets) == 1
+    assert_same_aggregates(*reload_aggregates(monkeypatch))
+
+
+def test_duplicates_are_skipped(workspace, generator):
+    reviews = batch(generator, 200, 0)
+    # Repeated rows within the batch count once
+    assert ingest.ingest(pd.concat([reviews, reviews.head(20)], ignore_index=True)) == 200
+    assert ingest.ingest(reviews) == 0
+    # Rows of data_final.csv itself are known too
+    assert ingest.ingest(pd.read_csv('data_final.csv').head(50)) == 0
+    assert len(get_store().table) == BASE_REVIEWS + 200
+
+
+def test_hash_set_sees_other_writers(workspace, generator):
+    store = get_store()
+    hash_set = ingest.seen_hashes(store)
+    assert ingest.seen_hashes(store) is hash_set
+    # Another process appending to the file invalidates this one's copy
+    other = ingest.HashSet(hash_set.path)
+    reviews = ingest.prepare(batch(generator, 10, 0))
+    other.add(ingest.content_hashes(reviews))
+    reloaded = ingest.seen_hashes(store)
+    assert reloaded is not hash_set
+    assert reloaded.contains(ingest.content_hashes(reviews)).all()
+
+
+def test_hash_set_merges_recent_hashes(tmp_path):
+    hash_set = ingest.HashSet(str(tmp_path / 'hashes.u64'))
+    rng = np.random.default_rng(0)
+    added = rng.integers(0, 2**63, 5000, dtype=np.uint64)
+    for chunk in np.array_split(added, 50):
+        hash_set.add(chunk)
+    assert len(hash_set) == len(np.unique(added))
+    assert hash_set.contains(added).all()
+    assert not hash_set.contains(np.array([2**63 + 1], dtype=np.uint64)).any()
+    # The file holds every hash once and reloads to the same set
+    assert len(ingest.HashSet(hash_set.path)) == len(hash_set)
+    assert os.path.getsize(hash_set.path) == 8 * len(hash_set)
+
+
+def test_store_segments_and_compaction(workspace, generator, monkeypatch):
+    monkeypatch.setattr(review_store, 'MAX_SEGMENTS', 2)
+    all_reviews = [pd.read_csv('data_final.csv')]
+    sources, mains = [], []
+    for i in range(3):
+        reviews = batch(generator, 100, 100 * i)
+        ingest.ingest(reviews)
+        all_reviews.append(reviews)
+        sources.append(get_store().sources)
+        index = json.load(open(os.path.join(review_store.STORE_DIR, review_store.INDEX_FILE), encoding='utf-8'))
+        # The third segment triggered a compaction into a new main file
+        assert len(index['segments']) == (0 if i == 2 else i + 1)
+        # Only the files the index lists are left
+        listed = {index['main']} | {segment['file'] for segment in index['segments']}
+        assert set(os.listdir(review_store.STORE_DIR)) == listed | {review_store.INDEX_FILE}
+        mains.append(index['main'])
+    assert mains[0] == mains[1] != mains[2]
+    # Every ingest changed the sources; compacting didn't
+    assert len({json.dumps(source, sort_keys=True) for source in sources}) == 3
+    expected = pd.concat(all_reviews, ignore_index=True)[HOTEL_ID].astype(str).value_counts()
+    store = get_store()
+    for hotel_id, count in expected.items():
+        assert store.num_reviews(hotel_id) == count
+        assert len(store.hotel_reviews(hotel_id)) == count
+
+
+def test_aggregate_deltas_and_compaction(workspace, generator, monkeypatch):
+    monkeypatch.setattr(aggregates, 'MAX_DELTAS', 2)
+    get_cube()
+    get_token_index()
+    for i in range(5):
+        ingest.ingest(batch(generator, 60, 60 * i))
+        for directory in (CUBE_DIR, INDEX_DIR):
+            manifest = json.load(open(os.path.join(directory, aggregates.MANIFEST_FILE), encoding='utf-8'))
+            assert manifest['sources'] == get_store().sources
+            assert len(manifest['deltas']) <= 2
+            # Only the listed deltas are on disk, and no write was left half done
+            listed = {name for delta in manifest['deltas'] for name in delta.values()}
+            names = os.listdir(directory)
+            assert {name for name in names if name.startswith('delta-')} == listed
+            assert not [name for name in names if name.endswith('.tmp')]
+        assert_same_aggregates(*reload_aggregates(monkeypatch))
+
+
+def test_delta_needs_current_aggregate(workspace, generator, monkeypatch):
+    # Without a saved aggregate for the store's previous sources no delta is written, and the
+    # next get_*() builds the aggregate from the store instead
+    assert ingest.ingest(batch(generator, 100, 0)) == 100
+    assert not os.path.exists(CUBE_DIR)
+    assert_same_aggregates(*reload_aggregates(monkeypatch))
+
+
+def test_undated_reviews_count_in_totals(workspace, generator, monkeypatch):
+    # Reviews whose stay details have no parseable date are left out of the monthly views only
+    reviews = pd.read_csv('data_final.csv')
+    reviews.loc[reviews.index[::3], 'Stay Details'] = 'No information'
+    reviews.to_csv('data_final.csv', index=False)
+    get_cube()
+    new_reviews = batch(generator, 100, 0)
+    new_reviews.loc[new_reviews.index[::2], 'Stay Details'] = 'No information'
+    ingest.ingest(new_reviews)
+    cube, token_index = reload_aggregates(monkeypatch)
+    assert_same_aggregates(cube, token_index)
+    table = get_store().table.select([HOTEL_ID, 'Date', 'Sentiment']).to_pandas().astype({HOTEL_ID: str, 'Sentiment': str})
+    assert table['Date'].isna().any()
+    expected = table.groupby([HOTEL_ID, 'Sentiment']).size().unstack(fill_value=0)
+    totals = cube.sentiment_totals()
+    pd.testing.assert_frame_equal(totals.loc[expected.index, expected.columns], expected,
+                                  check_dtype=False, check_names=False)
+    dated = table.dropna(subset=['Date'])[HOTEL_ID].value_counts()
+    for hotel_id, count in dated.items():
+        assert cube.monthly_sentiment_counts(hotel_id)['Count'].sum() == count
+        assert cube.stays_by_month(hotel_id)['Date'].notna().all()
+
+
+def test_save_replaces_deltas(workspace, generator, monkeypatch):
+    get_cube()
+    ingest.ingest(batch(generator, 100, 0))
+    assert any(name.startswith('delta-') for name in os.listdir(CUBE_DIR))
+    before = json.load(open(os.path.join(CUBE_DIR, aggregates.MANIFEST_FILE), encoding='utf-8'))
+    RollupCube.compact()
+    after = json.load(open(os.path.join(CUBE_DIR, aggregates.MANIFEST_FILE), encoding='utf-8'))
+    # New base files: the ones the old manifest listed were never rewritten, only removed
+    assert set(after['tables'].values()).isdisjoint(before['tables'].values())
+    assert set(os.listdir(CUBE_DIR)) == set(after['tables'].values()) | {aggregates.MANIFEST_FILE}
+    cube = RollupCube.load()
+    assert cube.sources == get_store().sources
+    pd.testing.assert_frame_equal(cube.counts, rebuilt(RollupCube).counts)
+
+
+@pytest.mark.parametrize('keys', [
+    [np.array(['a', 'a', 'b', 'c', 'c', 'c'], dtype=object)],
+    [np.array(['a', 'a', 'a', 'b']), np.array([1, 2, 2, 2])],
+])
+def test_row_ranges(keys):
+    ranges = aggregates.row_ranges(*keys)
+    rows = list(zip(*keys)) if len(keys) > 1 else list(keys[0])
+    for key, (start, stop) in ranges.items():
+        assert rows[start:stop] == [key] * (stop - start)
+    assert sum(stop - start for start, stop in ranges.values()) == len(rows)
+    assert aggregates.row_ranges(np.array([])) == {}
@@ -0,0 +1,97 @@
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+
+import pandas as pd
+
+from compact_model import EXPORT_DIR, get_compact_model
+
+
+# Raw review text (Body/Title) -> the preprocessed Review_new format the model was trained on:
+# NFC, lowercase, punctuation stripped and compound words joined with '_' (e.g. 'tuyệt_vời')
+
+# Punctuation and symbols become spaces; letters, digits, '_' and whitespace are kept
+PUNCTUATION = re.compile(r'[^\w\s]+')
+
+# Reviews up to this length go through the LRU cache; longer ones are rarely repeated
+CACHE_MAX_CHARS = 300
+CACHE_SIZE = 100000
+
+_END = None  # Trie key marking the end of a compound
+
+
+def build_trie(vocabulary):
+    # Syllable trie of the compound words (entries containing '_') of the vectorizer vocabulary
+    trie = {}
+    for word in vocabulary:
+        if '_' not in word:
+            continue
+        node = trie
+        for syllable in word.split('_'):
+            node = node.setdefault(syllable, {})
+        node[_END] = word
+    return trie
+
+
+class Normalizer:
+    def __init__(self, vocabulary, cache_size=CACHE_SIZE):
+        self.trie = build_trie(vocabulary)
+        self._cached = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def join_compounds(self, syllables):
+        # Greedy longest match over the trie, left to right
+        tokens = []
+        i = 0
+        while i < len(syllables):
+            node = self.trie.get(syllables[i])
+            match, match_end = None, i + 1
+            j = i + 1
+            while node is not None:
+                if _END in node:
+                    match, match_end = node[_END], j
+                if j == len(syllables):
+                    break
+                node = node.get(syllables[j])
+                j += 1
+            tokens.append(match if match is not None else syllables[i])
+            i = match_end
+        return tokens
+
+    def _normalize(self, text):
+        text = unicodedata.normalize('NFC', text).lower()
+        return ' '.join(self.join_compounds(PUNCTUATION.sub(' ', text).split()))
+
+    def normalize(self, text):
+        if not isinstance(text, str):
+            return ''
+        if len(text) <= CACHE_MAX_CHARS:
+            return self._cached(text)
+        return self._normalize(text)
+
+    def normalize_batch(self, texts):
+        # Each distinct text is normalized once
+        texts = pd.Series(texts, dtype=object)
+        uniques = pd.unique(texts)
+        normalized = dict(zip(uniques, map(self.normalize, uniques)))
+        return texts.map(normalized).tolist()
+
+
+_normalizers = {}
+_normalizers_lock = threading.Lock()
+
+
+def get_normalizer(export_dir=EXPORT_DIR):
+    # One normalizer per model version, built from the vectorizer vocabulary of its compact export
+    model = get_compact_model(export_dir)
+    with _normalizers_lock:
+        normalizer = _normalizers.get(model.digest)
+        if normalizer is None:
+            normalizer = Normalizer(model.vocabulary.tolist())
+            _normalizers.clear()
+            _normalizers[model.digest] = normalizer
+        return normalizer
+
+
+def normalize_batch(texts, export_dir=EXPORT_DIR):
+    return get_normalizer(export_dir).normalize_batch(texts)
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import PersistedAggregate, get_aggregate, row_ranges
+from review_store import HOTEL_ID, get_store
+from tracing import span
+
+
+INDEX_DIR = os.path.join('.cache', 'token_index')
+COUNTS_FILE = 'counts.parquet'
+
+INDEX_KEYS = [HOTEL_ID, 'Sentiment']
+SOURCE_COLUMNS = [HOTEL_ID, 'Sentiment', 'Review_new']
+
+
+def count_tokens(reviews):
+    # Whitespace tokens of Review_new counted per (hotel, sentiment). Groups keep the order
+    # in which tokens first appear, like a Counter fed the same reviews.
+    tokens = reviews[SOURCE_COLUMNS].astype({HOTEL_ID: object, 'Sentiment': object})
+    tokens = tokens.assign(Token=tokens['Review_new'].str.split()).explode('Token')
+    tokens = tokens.dropna(subset=INDEX_KEYS + ['Token'])
+    return tokens.groupby(INDEX_KEYS + ['Token'], sort=False).size().reset_index(name='Count')
+
+
+def wordcloud_frequencies(frequencies):
+    # Token filtering WordCloud.generate() would apply to raw text. wordcloud is imported here
+    # so importing the index doesn't load it (and matplotlib) for every page.
+    from wordcloud import STOPWORDS
+    return {word: count for word, count in frequencies.items()
+            if len(word) > 1 and not word.isdigit() and word.lower() not in STOPWORDS}
+
+
+class TokenIndex(PersistedAggregate):
+    # Token frequencies per hotel and sentiment. Word clouds and top-word tables are answered
+    # from these counts instead of re-tokenizing review text on every render.
+    DIRECTORY = INDEX_DIR
+    TABLES = {'counts': COUNTS_FILE}
+    KEYS = {'counts': INDEX_KEYS + ['Token']}
+    SOURCE_COLUMNS = SOURCE_COLUMNS
+
+    def __init__(self, counts, sources=None):
+        super().__init__(sources)
+        # Stable sort keeps the first-appearance order of tokens within each key
+        self.counts = counts.sort_values(INDEX_KEYS, kind='stable', ignore_index=True)
+        self._index()
+
+    def _index(self):
+        # (hotel, sentiment) -> row range over the sorted counts
+        self._ranges = row_ranges(self.counts[HOTEL_ID].to_numpy(), self.counts['Sentiment'].to_numpy())
+
+    @classmethod
+    def build(cls, reviews):
+        with span('aggregate.build_token_index', rows=len(reviews)):
+            return cls(count_tokens(reviews))
+
+
+    def _slice(self, hotel_id, sentiment):
+        start, stop = self._ranges.get((hotel_id, sentiment), (0, 0))
+        return self.counts.iloc[start:stop]
+
+    def frequencies(self, hotel_id, sentiment, exclude=None):
+        # exclude: sentiment whose vocabulary is removed, e.g. negative words not used in positive reviews
+        counts = self._slice(hotel_id, sentiment)
+        if exclude is not None:
+            counts = counts[~counts['Token'].isin(self._slice(hotel_id, exclude)['Token'])]
+        return dict(zip(counts['Token'], counts['Count']))
+
+    def top_k(self, hotel_id, sentiment, k=10, exclude=None):
+        # Same order as Counter.most_common: by count, ties in first-appearance order
+        frequencies = self.frequencies(hotel_id, sentiment, exclude)
+        words = np.array(list(frequencies), dtype=object)
+        counts = np.fromiter(frequencies.values(), dtype=np.int64, count=len(frequencies))
+        top = np.argsort(-counts, kind='stable')[:k]
+        return pd.DataFrame({'Word': words[top], 'Count': counts[top]})
+
+
+def get_token_index(index_dir=INDEX_DIR):
+    # Built once from the review store and rebuilt only when the store's sources change
+    return get_aggregate(TokenIndex, index_dir, get_store())
@@ -0,0 +1,268 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from atomic_files import write_text
+
+
+# Lightweight tracing of the app's hot paths:
+#   with span('filter.hotel_reviews', hotel=hotel_id) as s:
+#       reviews = store.hotel_reviews(hotel_id)
+#       s.set_rows(len(reviews))
+# A span records its duration, rows and resident memory growth. Spans are aggregated per name
+# and page into Prometheus metrics (a text file and an optional /metrics endpoint); the latest
+# spans are kept with their hotel/session attributes for the in-app debug panel.
+# Off unless TRACING_ENABLED is set; a disabled span is one shared no-op object.
+ENABLED = os.environ.get('TRACING_ENABLED', '').lower() not in ('', '0', 'false', 'no')
+METRICS_FILE = os.environ.get('METRICS_FILE', os.path.join('.cache', 'metrics', 'sensity.prom'))
+# Port of the /metrics endpoint; 0 doesn't start it
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+
+METRIC_PREFIX = 'sensity'
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Finished spans kept for the debug panel
+RECENT_SPANS = 5000
+# Span attributes that become Prometheus labels; the others (hotel, session, ...) have too
+# many values and are only kept on the recent spans
+LABELS = ['page']
+
+_enabled = ENABLED
+_local = threading.local()
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(value):
+    global _enabled
+    _enabled = bool(value)
+
+
+def rss():
+    # Resident set size in bytes from /proc; None where it isn't available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def context(**attrs):
+    # Attributes added to every span this thread records from now on, e.g. the session and
+    # run of the Streamlit script thread
+    _local.attrs = attrs
+
+
+def annotate(**attrs):
+    _local.attrs = dict(getattr(_local, 'attrs', {}), **attrs)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_rows(self, rows):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ('name', 'rows', 'attrs', 'parent', '_start', '_rss')
+
+    def __init__(self, name, rows, attrs):
+        self.name = name
+        self.rows = rows
+        self.attrs = attrs
+
+    def set_rows(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        stack = _local.__dict__.setdefault('stack', [])
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self._rss = rss()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        end_rss = rss()
+        _local.stack.pop()
+        memory = end_rss - self._rss if end_rss is not None and self._rss is not None else None
+        recorder.record(self.name, duration, self.rows, memory, self.attrs, self.parent, exc_type is not None)
+        return False
+
+
+def span(name, rows=None, **attrs):
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, rows, attrs)
+
+
+def record(name, duration, rows=None, memory=None, **attrs):
+    # For work that isn't one block of this thread, e.g. a chart drawn in a worker process
+    if _enabled:
+        recorder.record(name, duration, rows, memory, attrs)
+
+
+# prefix -> (callable returning {name: number}, names exported as counters)
+_stats = {}
+
+
+def register_stats(prefix, stats, counters=()):
+    # Process state polled on every scrape, e.g. register_stats('chart_cache', chart_cache.stats,
+    # counters=['hits', 'misses']); the other values are exported as gauges
+    _stats[prefix] = (stats, frozenset(counters))
+
+
+def _stats_lines():
+    lines = []
+    for prefix, (stats, counters) in sorted(_stats.items()):
+        for key, value in stats().items():
+            kind = 'counter' if key in counters else 'gauge'
+            name = f'{METRIC_PREFIX}_{prefix}_{key}' + ('_total' if kind == 'counter' else '')
+            lines += [f'# HELP {name} {prefix} {key}.', f'# TYPE {name} {kind}', f'{name} {value}']
+    return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Recorder:
+    def __init__(self, buckets=DURATION_BUCKETS, recent=RECENT_SPANS):
+        self.buckets = buckets
+        self.recent = deque(maxlen=recent)
+        # (name, *label values) -> [count, duration sum, bucket counts, rows, memory sum, memory max, errors]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration, rows=None, memory=None, attrs=None, parent=None, error=False):
+        attrs = dict(getattr(_local, 'attrs', {}), **(attrs or {}))
+        key = (name,) + tuple(str(attrs.get(label, '')) for label in LABELS)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0, 0.0, [0] * (len(self.buckets) + 1), 0, 0, None, 0]
+            series[0] += 1
+            series[1] += duration
+            series[2][bisect_left(self.buckets, duration)] += 1
+            series[3] += rows or 0
+            if memory is not None:
+                series[4] += memory
+                series[5] = memory if series[5] is None else max(series[5], memory)
+            series[6] += error
+            self.recent.append(dict(attrs, name=name, time=time.time(), duration=duration, rows=rows,
+                                    memory=memory, parent=parent, error=error))
+
+    def spans(self, **match):
+        # Recent spans whose attributes equal the given ones, oldest first
+        with self._lock:
+            spans = list(self.recent)
+        return [s for s in spans if all(s.get(key) == value for key, value in match.items())]
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self.recent.clear()
+
+    def prometheus(self):
+        # Prometheus text exposition format
+        with self._lock:
+            series = {key: [value[0], value[1], list(value[2])] + value[3:] for key, value in self._series.items()}
+        duration = f'{METRIC_PREFIX}_span_duration_seconds'
+        lines = [f'# HELP {duration} Time spent in each traced span.', f'# TYPE {duration} histogram']
+        metrics = [
+            (f'{METRIC_PREFIX}_span_rows_total', 'counter', 'Rows processed by each traced span.', 3),
+            (f'{METRIC_PREFIX}_span_memory_delta_bytes_sum', 'gauge',
+             'Resident memory growth summed over the spans.', 4),
+            (f'{METRIC_PREFIX}_span_memory_delta_bytes_max', 'gauge', 'Largest resident memory growth of one span.', 5),
+            (f'{METRIC_PREFIX}_span_errors_total', 'counter', 'Spans that ended with an exception.', 6),
+        ]
+        extra = {name: [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'] for name, kind, help_text, _ in metrics}
+        for key in sorted(series):
+            count, total, buckets = series[key][:3]
+            labels = ','.join(f'{label}="{_escape(value)}"' for label, value in zip(['span'] + LABELS, key))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), buckets):
+                cumulative += bucket
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{duration}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{duration}_sum{{{labels}}} {total!r}')
+            lines.append(f'{duration}_count{{{labels}}} {count}')
+            for name, _, _, position in metrics:
+                if series[key][position] is not None:
+                    extra[name].append(f'{name}{{{labels}}} {series[key][position]}')
+        for name, _, _, _ in metrics:
+            lines += extra[name]
+        lines += _stats_lines()
+        return '\n'.join(lines) + '\n'
+
+
+recorder = Recorder()
+# Sessions flush at the end of every script run; one write at a time per process
+_write_lock = threading.Lock()
+
+
+def write_metrics(path=METRICS_FILE):
+    # For a node_exporter textfile collector; replaced atomically so it is never read half written
+    with _write_lock:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        write_text(path, recorder.prometheus())
+
+
+def flush(path=METRICS_FILE):
+    # Called from the page: a metrics file that can't be written must not fail the page
+    if _enabled and path:
+        try:
+            write_metrics(path)
+        except OSError:
+            pass
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = recorder.prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    # One /metrics endpoint per process, served from a daemon thread. None if disabled or if
+    # the port is taken, e.g. by another server process on the same host.
+    global _server
+    with _server_lock:
+        if _server is None and _enabled and port:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError:
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server